@@ -1,58 +1,416 @@
 import os
 import math
-import pandas as pd
-from matplotlib import pyplot
-
-def get_gc_content(sequence, verbose=False):
-    """Sequence can either be FASTA file location or string"""
-
-    a_count = 0
-    t_count = 0
-    c_count = 0
-    g_count = 0
-
-    def _count_sequence(sequence):
-        if not ">" in sequence:
-            for character in sequence:
-                if character in ["a", "A"]:
-                    nonlocal a_count
-                    a_count += 1
-                elif character in ["t", "T"]:
-                    nonlocal t_count
-                    t_count += 1
-                elif character in ["c", "C"]:
-                    nonlocal c_count
-                    c_count += 1
-                elif character in ["g", "G"]:
-                    nonlocal g_count
-                    g_count += 1
-    if os.path.isfile(sequence):
+import gzip
+import mmap
+from bisect import bisect_right
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+
+_BASES = b"ACGTN"
+_HEADER_MARKS = b">#"
+_LINE_START, _MID_LINE, _IN_HEADER = range(3)  # Where a chunk boundary fell, see _count_chunk()
+
+
+def _count_range(counts, data, start, end):
+    """Adds the counts of each base (either case) in data[start:end] to 'counts'."""
+    if end <= start:
+        return
+    lowered = np.frombuffer(data, dtype=np.uint8, count=end - start, offset=start) | 0x20  # Only 'A' and 'a' give 'a'
+    for i, base in enumerate(_BASES.lower()):
+        counts[i] += int(np.count_nonzero(lowered == base))
+
+
+def _count_chunk(counts, chunk, state=_LINE_START, start=0, end=None):
+    """Counts bases in chunk[start:end] of FASTA, skipping '>' and '#' lines. Returns the state for the next chunk.
+
+    A chunk can end part way through a header, so the state says whether the next one starts mid header,
+    at the start of a line (where a header may begin) or mid sequence line. 'chunk' can be bytes or an mmap.
+    """
+    end = len(chunk) if end is None else end
+    pos = search = start
+    if state == _IN_HEADER or (state == _LINE_START and end > start and chunk[start] in _HEADER_MARKS):
+        newline = chunk.find(b"\n", start, end)
+        if newline < 0:
+            return _IN_HEADER
+        pos, search = newline + 1, newline
+    next_marks = [-2, -2]  # Next "\n>" and "\n#", found lazily so sparse '#' lines don't mean rescanning the chunk
+    while True:
+        for i, mark in enumerate(_HEADER_MARKS):
+            if next_marks[i] != -1 and next_marks[i] < search:
+                next_marks[i] = chunk.find(b"\n" + bytes([mark]), search, end)
+        header = min([mark for mark in next_marks if mark >= 0], default=-1)
+        if header < 0:
+            _count_range(counts, chunk, pos, end)
+            break
+        _count_range(counts, chunk, pos, header)
+        newline = chunk.find(b"\n", header + 1, end)
+        if newline < 0:
+            return _IN_HEADER
+        pos, search = newline + 1, newline
+    return _LINE_START if end > start and chunk[end - 1] == ord("\n") else _MID_LINE
+
+
+def _molar_mass(counts):
+    """GC fraction and molar mass from a {base: count} dict, counting only A, C, G and T."""
+    length = counts["A"] + counts["C"] + counts["G"] + counts["T"]
+    if length == 0:
+        return float("nan"), 0.0
+    gc_percent = (counts["G"] + counts["C"]) / length
+    return gc_percent, length*(617.41*(1-gc_percent)+618.39*gc_percent)
+
+
+def _open_sequence(path):
+    """Opens a sequence file for binary reading, decompressing it if it is gzipped.
+
+    Returns (readable file, underlying file) so callers can report progress against the size on disk.
+    """
+    raw = open(path, "rb")
+    if raw.read(2) == b"\x1f\x8b":
+        raw.seek(0)
+        return gzip.GzipFile(fileobj=raw), raw
+    raw.seek(0)
+    return raw, raw
+
+
+def _sequence_format(path):
+    """'fastq' if the first record starts with '@', 'fasta' otherwise."""
+    f, raw = _open_sequence(path)
+    with raw, f:
+        for line in f:
+            if line.strip():
+                return "fastq" if line[:1] == b"@" else "fasta"
+    return "fasta"
+
+
+SequenceStats = namedtuple("SequenceStats", ["name", "length", "gc_content", "n_count", "molar_mass", "counts"])
+
+
+def _stats(name, counts, length):
+    """SequenceStats from a {base: count} dict, GC and mass are worked out as in get_gc_content()."""
+    gc_percent, molar_mass = _molar_mass(counts)
+    return SequenceStats(name, length, gc_percent, counts["N"], molar_mass, counts)
+
+
+def iter_records(path):
+    """Yields (name, sequence) for every record of a FASTA or FASTQ file, gzipped or not, without prompting."""
+    fastq = _sequence_format(path) == "fastq"
+    f, raw = _open_sequence(path)
+    with raw, f:
+        if fastq:
+            for header, sequence, _, _ in zip(*[f] * 4):  # FASTQ records are always four lines here
+                yield header[1:].strip().decode(), sequence.strip().decode()
+            return
+        name, lines = None, []
+        for line in f:
+            if line[:1] == b">":
+                if name is not None or lines:
+                    yield name, b"".join(lines).decode()
+                name, lines = line[1:].strip().decode(), []
+            elif line[:1] != b"#":
+                lines.append(line.strip())
+        if name is not None or lines:
+            yield name, b"".join(lines).decode()
+
+
+def iter_record_stats(path, chunk_size=1 << 24):
+    """Yields SequenceStats for every record of a FASTA or FASTQ file, gzipped or not, in one streaming pass.
+
+    Sequence is counted in pieces of up to 'chunk_size' bytes, so even whole chromosomes never sit in memory.
+    """
+    fastq = _sequence_format(path) == "fastq"
+    f, raw = _open_sequence(path)
+    with raw, f:
+        if fastq:
+            for header, sequence, _, _ in zip(*[f] * 4):
+                counts = [0] * len(_BASES)
+                sequence = sequence.strip()
+                _count_range(counts, sequence, 0, len(sequence))
+                yield _stats(header[1:].strip().decode(), dict(zip(_BASES.decode(), counts)), len(sequence))
+            return
+        name, counts, length, pending, pending_size = None, [0] * len(_BASES), 0, [], 0
+        for line in f:
+            if line[:1] == b">":
+                if pending:
+                    _count_range(counts, b"".join(pending), 0, pending_size)
+                if name is not None or length:
+                    yield _stats(name, dict(zip(_BASES.decode(), counts)), length)
+                name, counts, length, pending, pending_size = line[1:].strip().decode(), [0] * len(_BASES), 0, [], 0
+            elif line[:1] != b"#":
+                line = line.strip()
+                length += len(line)
+                pending.append(line)
+                pending_size += len(line)
+                if pending_size >= chunk_size:  # Count in big batches, NumPy calls per line would be slow
+                    _count_range(counts, b"".join(pending), 0, pending_size)
+                    pending, pending_size = [], 0
+        if pending:
+            _count_range(counts, b"".join(pending), 0, pending_size)
+        if name is not None or length:
+            yield _stats(name, dict(zip(_BASES.decode(), counts)), length)
+
+
+def aggregate_stats(stats, name="total") -> SequenceStats:
+    """Combines the SequenceStats of many records into one covering all of them."""
+    counts = dict.fromkeys(_BASES.decode(), 0)
+    length = 0
+    for record in stats:
+        length += record.length
+        for base, count in record.counts.items():
+            counts[base] += count
+    return _stats(name, counts, length)
+
+
+def count_bases(sequence, chunk_size=1 << 24, verbose=False) -> dict:
+    """Counts A, C, G, T and N (either case) in a FASTA file or sequence string, skipping '>' and '#' lines.
+
+    Files are read as bytes in 'chunk_size' pieces, so memory use stays flat whatever the file size.
+    Gzipped files and FASTQ are read too.
+    """
+    counts = [0] * len(_BASES)
+    if isinstance(sequence, str) and os.path.isfile(sequence) and _sequence_format(sequence) == "fastq":
+        return aggregate_stats(iter_record_stats(sequence, chunk_size)).counts
+    elif isinstance(sequence, str) and os.path.isfile(sequence):
         filesize = os.path.getsize(sequence)
-        bytes_read = 0
-        last_update = ""
-        line_num = 0
-        with open(sequence, 'r') as f:
-            # Go to next line
-            line = f.readline()
-            while line:
-                # Stop when you get some weird shit
-                if line[0] == ">" or line[0] == "#":
-                    print(line)
-                    input("Press Enter to continue...")
-                # Track progess of reading file
-                bytes_read += len(line.encode('utf-8'))
-                progress_percent = math.floor(bytes_read * 100 / filesize)
-                if progress_percent % 5 == 0:
-                    if last_update != progress_percent:
+        last_update = None
+        state = _LINE_START
+        f, raw = _open_sequence(sequence)
+        with raw, f:
+            chunk = f.read(chunk_size)
+            while chunk:
+                state = _count_chunk(counts, chunk, state)
+                if verbose:  # Track progess of reading file
+                    progress_percent = math.floor(raw.tell() * 100 / filesize) // 5 * 5
+                    if progress_percent != last_update:
                         last_update = progress_percent
                         print(f"Progress: {progress_percent}%")
-                line_num += 1
-                # Track GC
-                _count_sequence(line)
-                line = f.readline()
+                chunk = f.read(chunk_size)
+    else:
+        if isinstance(sequence, str):
+            sequence = sequence.encode("ascii", "replace")
+        _count_chunk(counts, sequence)
+    return dict(zip(_BASES.decode(), counts))
+
+
+_FASTA_EXTENSIONS = (".fa", ".fasta", ".fna", ".ffn", ".frn", ".fas")
+
+
+def _shards(path, shard_size):
+    """Splits a file into (path, start, end) byte ranges of about 'shard_size' that all begin at the start of a line."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        bounds = [0]
+        while bounds[-1] + shard_size < size:
+            newline = data.find(b"\n", bounds[-1] + shard_size)
+            if newline < 0:
+                break
+            bounds.append(newline + 1)
+    bounds.append(size)
+    return [(path, start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _count_shard(path, start, end, chunk_size=1 << 24):
+    """Counts one shard of a file through mmap, or the whole file if it can't be sharded (start is None)."""
+    if start is None:
+        return count_bases(path, chunk_size)
+    counts = [0] * len(_BASES)
+    state = _LINE_START  # Shards always start on a new line
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for chunk_start in range(start, end, chunk_size):
+            state = _count_chunk(counts, data, state, chunk_start, min(chunk_start + chunk_size, end))
+    return dict(zip(_BASES.decode(), counts))
+
+
+def count_bases_parallel(paths, workers=None, shard_size=1 << 26) -> dict:
+    """count_bases() for one or more big files using a process pool, returns {path: {base: count}}.
+
+    'paths' can be a file, a directory (every FASTA file in it) or a list of files. Plain FASTA files are split into
+    'shard_size' byte ranges on line boundaries that workers read straight from the page cache through mmap, so no
+    sequence is copied between processes. Gzipped and FASTQ files are counted whole by a single worker each.
+    Counts are exactly the same as count_bases() gives.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    if isinstance(paths, str) and os.path.isdir(paths):
+        paths = sorted(os.path.join(paths, name) for name in os.listdir(paths)
+                       if name.lower().endswith(_FASTA_EXTENSIONS)
+                       or name.lower().endswith(tuple(ext + ".gz" for ext in _FASTA_EXTENSIONS)))
+    elif isinstance(paths, str):
+        paths = [paths]
+    tasks = []
+    for path in paths:
+        with open(path, "rb") as f:
+            shardable = f.read(2) != b"\x1f\x8b" and _sequence_format(path) == "fasta"
+        tasks.extend(_shards(path, shard_size) if shardable else [(path, None, None)])
+    totals = {path: dict.fromkeys(_BASES.decode(), 0) for path in paths}
+    with ProcessPoolExecutor(workers) as pool:
+        for (path, _, _), counts in zip(tasks, pool.map(_count_shard, *zip(*tasks)) if tasks else []):
+            for base, count in counts.items():
+                totals[path][base] += count
+    return totals
+
+
+FaiEntry = namedtuple("FaiEntry", ["name", "length", "offset", "line_bases", "line_width"])
+
+
+def build_fai(path, write=True) -> dict:
+    """Indexes a FASTA file the way 'samtools faidx' does, returning {name: FaiEntry}.
+
+    The index is written next to the file as '<path>.fai' unless 'write' is False or the folder isn't writable.
+    Like samtools, every line of a record but the last must be the same length.
+    """
+    entries = {}
+    name = None
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            line_width = len(line)
+            if line[:1] == b">":
+                if name is not None:
+                    entries[name] = FaiEntry(name, length, seq_offset, line_bases or 0, width or 0)
+                name = line[1:].split()[0].decode() if line[1:].split() else ""
+                if name in entries:
+                    raise ValueError(f"Duplicate sequence name '{name}' in {path}")
+                length, seq_offset, line_bases, width, short_line = 0, offset + line_width, None, None, False
+            elif name is not None and line.strip():
+                bases = len(line.rstrip(b"\r\n"))
+                if short_line or (line_bases is not None and (bases > line_bases or bases == line_bases and line_width != width)):
+                    raise ValueError(f"Different line length in sequence '{name}' of {path}")
+                if line_bases is None:
+                    line_bases, width = bases, line_width
+                short_line = bases < line_bases
+                length += bases
+            elif name is None and line.strip():
+                raise ValueError(f"{path} doesn't start with a '>' header line")
+            offset += line_width
+    if name is not None:
+        entries[name] = FaiEntry(name, length, seq_offset, line_bases or 0, width or 0)
+    if write:
+        try:
+            with open(path + ".fai", "w") as f:
+                for entry in entries.values():
+                    f.write("\t".join(str(field) for field in entry) + "\n")
+        except OSError:
+            pass
+    return entries
+
+
+def read_fai(path) -> dict:
+    """Reads a samtools style '.fai' index into {name: FaiEntry}."""
+    entries = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            entries[fields[0]] = FaiEntry(fields[0], *[int(field) for field in fields[1:5]])
+    return entries
+
+
+class FastaIndex:
+    """Random access to the contigs of an indexed FASTA file.
+
+    Uses '<path>.fai' if it is newer than the file and builds it otherwise, so indexing only happens once per file.
+    Slices are read straight out of an mmap in time proportional to their length. Base counts are kept per
+    'block_size' bases of each contig after the first time they are asked for, so stats for any region only
+    need to count the partial blocks at its ends.
+    """
+
+    def __init__(self, path, block_size=1 << 16):
+        self.path = path
+        self.block_size = block_size
+        fai = path + ".fai"
+        if os.path.isfile(fai) and os.path.getmtime(fai) >= os.path.getmtime(path):
+            self.contigs = read_fai(fai)
+        else:
+            self.contigs = build_fai(path)
+        self._file = open(path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+        self._block_counts = {}
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _region(self, region, start=None, end=None):
+        """Resolves 'contig', 'contig:start-end' (1-based, inclusive) or explicit 0-based [start, end) bounds."""
+        if start is None and end is None and region not in self.contigs and ":" in region:
+            region, bounds = region.rsplit(":", 1)
+            first, _, last = bounds.replace(",", "").partition("-")
+            start, end = int(first) - 1, int(last) if last else None
+        if region not in self.contigs:
+            raise KeyError(f"Sequence '{region}' is not in {self.path}")
+        entry = self.contigs[region]
+        start = max(0, start or 0)
+        end = entry.length if end is None else min(end, entry.length)
+        if start > end:
+            raise ValueError(f"Region {region}:{start+1}-{end} ends before it starts")
+        return entry, start, end
 
+    def _offset(self, entry, position):
+        """Byte offset of 0-based 'position' in a contig."""
+        if entry.line_bases == 0:
+            return entry.offset
+        return entry.offset + position // entry.line_bases * entry.line_width + position % entry.line_bases
+
+    def fetch(self, region, start=None, end=None) -> str:
+        """Sequence of 'contig:start-end' (1-based, inclusive like samtools) or a contig between 0-based start, end."""
+        entry, start, end = self._region(region, start, end)
+        raw = self._data[self._offset(entry, start):self._offset(entry, end)]
+        return raw.replace(b"\n", b"").replace(b"\r", b"").decode()
+
+    def _cumulative_counts(self, entry):
+        """Running A/C/G/T/N counts at every block boundary of a contig, worked out once per contig."""
+        if entry.name not in self._block_counts:
+            boundaries = list(range(0, entry.length, self.block_size)) + [entry.length]
+            blocks = np.zeros((len(boundaries), len(_BASES)), dtype=np.int64)
+            for i, (first, last) in enumerate(zip(boundaries, boundaries[1:])):
+                counts = [0] * len(_BASES)
+                _count_range(counts, self._data, self._offset(entry, first), self._offset(entry, last))
+                blocks[i + 1] = counts
+            self._block_counts[entry.name] = np.cumsum(blocks, axis=0)
+        return self._block_counts[entry.name]
+
+    def base_counts(self, region, start=None, end=None) -> dict:
+        """{base: count} for a contig or region, see fetch() for how regions are given."""
+        entry, start, end = self._region(region, start, end)
+        cumulative = self._cumulative_counts(entry)
+        first_block = -(-start // self.block_size)
+        last_block = end // self.block_size
+        if first_block > last_block:  # Region is inside one block
+            counts = [0] * len(_BASES)
+            _count_range(counts, self._data, self._offset(entry, start), self._offset(entry, end))
+        else:
+            counts = list(cumulative[last_block] - cumulative[first_block])
+            for first, last in ((start, first_block * self.block_size), (last_block * self.block_size, end)):
+                _count_range(counts, self._data, self._offset(entry, first), self._offset(entry, last))
+        return dict(zip(_BASES.decode(), (int(count) for count in counts)))
+
+    def stats(self, region=None, start=None, end=None) -> SequenceStats:
+        """SequenceStats for a contig or region, or the whole file if 'region' is None."""
+        if region is None:
+            return aggregate_stats((self.stats(name) for name in self.contigs), name=os.path.basename(self.path))
+        entry, start, end = self._region(region, start, end)
+        name = entry.name if (start, end) == (0, entry.length) else f"{entry.name}:{start+1}-{end}"
+        return _stats(name, self.base_counts(entry.name, start, end), end - start)
+
+
+def get_gc_content(sequence, verbose=False, workers=1):
+    """Sequence can either be FASTA file location or string
+
+    Set 'workers' to count a big file across that many processes (None for every core).
+    """
+    if workers != 1 and os.path.isfile(sequence):
+        counts = count_bases_parallel(sequence, workers=workers)[sequence]
     else:
-        _count_sequence(sequence)
+        counts = count_bases(sequence, verbose=verbose)
+    g_count, c_count, a_count, t_count = counts["G"], counts["C"], counts["A"], counts["T"]
     length = (g_count + c_count + a_count + t_count)
     if length == 0:
         raise ValueError("No bases could be identified in supplied sequence")
@@ -62,11 +420,19 @@ def get_gc_content(sequence, verbose=False):
     molar_mass = length*(617.41*(1-gc_percent)+618.39*gc_percent)
     return gc_percent, molar_mass
 
-def simulate_pcr(starting_M, cycles=35, annealing_sec=30, length=1000, units=1, gc_product=.5, m_nucleotides=0.0002):
+def simulate_pcr_grid(starting_M, cycles=35, annealing_sec=30, length=1000, units=1, gc_product=.5,
+                      m_nucleotides=0.0002) -> np.ndarray:
+    """Runs simulate_pcr() for every combination of parameters at once, without plotting.
+
+    Every parameter but 'cycles' can be a number or an array, and they are broadcast against each other, so
+    np.meshgrid() output or one array per parameter both work. All scenarios are stepped together a cycle at a
+    time, with masks picking whether each one is limited by enzyme, template or nucleotides that cycle.
+    Returns molar concentrations shaped (*broadcast shape, cycles + 1), column 0 being the starting concentration.
+    """
     #  https://doi.org/10.1371/journal.pone.0042063 Based on this paper
-    c = starting_M
+    c, t, length, units, gc_product, m_nucleotides = np.broadcast_arrays(
+        *[np.asarray(value, dtype=float) for value in (starting_M, annealing_sec, length, units, gc_product, m_nucleotides)])
     k = 3 * pow(10, 5)
-    t = annealing_sec
     # https://www.wolframalpha.com/input/?i=%5B%281+minutes+%2F+4000%29+*
     # +avogadro%27s+constant+*+%281mol%2F1000000000nmol%29+*+1nmol%5D+%2F
     # +%5B%2830minutes+%2F+10nmol%29+*+1nmol%5D+*+%5B1%2Favogadro%27s+constant%5D
@@ -74,35 +440,263 @@ def simulate_pcr(starting_M, cycles=35, annealing_sec=30, length=1000, units=1,
     c_phusion = units * 8.333 * pow(10, -14)
     # For nucleotide limiting math
     free_nucleotides = m_nucleotides*6.022140857*pow(10, 23)
+    nucleotide_usage = length*(.5+np.abs(gc_product-0.5))
+    sim_data = np.empty(c.shape + (cycles + 1,))
+    sim_data[..., 0] = c
+    for cycle in range(cycles):
+        c_previous = sim_data[..., cycle]
+        kct = k*c_previous*t
+        enzyme_limited = c_previous/(1+kct) > c_phusion
+        c = np.where(enzyme_limited, c_previous + c_phusion,  # If limit is enzyme
+                     c_previous * (2 + kct) / (1 + kct))  # If limit is template
+        new_molecules = (c-c_previous)*6.022140857*pow(10, 23)
+        free_nucleotides = free_nucleotides - nucleotide_usage*new_molecules
+        sim_data[..., cycle + 1] = np.where(free_nucleotides < 0, c_previous, c)  # If limit is nucleotides
+    return sim_data
+
+
+def plot_pcr(sim_data, ax=None):
+    """Plots one simulate_pcr_grid() trace, or one line per scenario for a 2D array, on a log scale."""
+    from matplotlib import pyplot  # Slow to import, so only done when something is actually plotted
+    if ax is None:
+        _, ax = pyplot.subplots()
+    ax.plot(np.atleast_2d(sim_data).reshape(-1, np.shape(sim_data)[-1]).T)
+    ax.set_yscale('log')
+    ax.set_ylabel('Mols Product')
+    ax.set_xlabel('PCR Cycles')
+    ax.set_title('PCR Simulation')
+    return ax
+
+
+def simulate_pcr(starting_M, cycles=35, annealing_sec=30, length=1000, units=1, gc_product=.5, m_nucleotides=0.0002,
+                 plot=True):
+    """Simulates one PCR and returns the final molar concentration, plotting it unless 'plot' is False.
+
+    Use simulate_pcr_grid() to run many parameter combinations in one go.
+    """
+    sim_data = simulate_pcr_grid(starting_M, cycles, annealing_sec, length, units, gc_product, m_nucleotides)
+    if plot:
+        from matplotlib import pyplot
+        plot_pcr(sim_data)
+        pyplot.show()
+    return float(sim_data[-1])
+
+
+def _quantize(value, digits):
+    """Rounds to 'digits' significant figures so nearly identical requests share a cache entry."""
+    return float(f"{float(value):.{digits}g}")
+
+
+@lru_cache(maxsize=4096)
+def _pcr_yield(starting_M, cycles, annealing_sec, length, units, gc_product, m_nucleotides):
+    c = starting_M
+    k = 3 * pow(10, 5)
+    t = annealing_sec
+    c_phusion = units * 8.333 * pow(10, -14)
+    free_nucleotides = m_nucleotides*6.022140857*pow(10, 23)
     nucleotide_usage = length*(.5+abs(gc_product-0.5))
-    sim_data = pd.DataFrame(data=None, columns=["Molar_Concentration"])
-    sim_data = sim_data.append({"Molar_Concentration": c}, ignore_index=True)
-    for _ in range(0, cycles):
+    for cycle in range(cycles):
+        if c/(1+k*c*t) > c_phusion:  # Enzyme limited from here on, since c/(1+kct) only grows with c
+            per_cycle = nucleotide_usage*c_phusion*6.022140857*pow(10, 23)
+            cycles_fed = math.floor(free_nucleotides / per_cycle) if per_cycle > 0 else cycles  # Before dNTPs run out
+            return c + min(cycles - cycle, cycles_fed) * c_phusion
         c_previous = c
-        if c/(1+k*c*t) > c_phusion:  #  If limit is enzyme
-            c = c + c_phusion
-        else:  # If limit is template
-            c= c * (2 + k * c * t) / (1 + k * c * t)
-        if True:  # If limit is nucleotides
-            new_molecules = (c-c_previous)*6.022140857*pow(10, 23)
-            free_nucleotides -= nucleotide_usage*new_molecules
-            if free_nucleotides < 0:
-                c = c_previous
-
-        sim_data = sim_data.append({"Molar_Concentration": c}, ignore_index=True)
-    fig, ax = pyplot.subplots()
-    sim_data.plot(ax=ax)
-    ax.set_yscale('log')
-    pyplot.ylabel('Mols Product')
-    pyplot.xlabel('PCR Cycles')
-    pyplot.title('PCR Simulation')
-    pyplot.gca().get_legend().remove()
-    pyplot.show()
+        c = c * (2 + k * c * t) / (1 + k * c * t)  # Template limited
+        free_nucleotides -= nucleotide_usage*(c-c_previous)*6.022140857*pow(10, 23)
+        if free_nucleotides < 0:  # Out of nucleotides, nothing changes after this
+            return c_previous
     return c
 
+
+def pcr_yield(starting_M, cycles=35, annealing_sec=30, length=1000, units=1, gc_product=.5, m_nucleotides=0.0002,
+              digits=6) -> float:
+    """Final molar concentration simulate_pcr() would give, without the plot or stepping through every cycle.
+
+    Once a reaction is enzyme limited it grows linearly until the nucleotides run out, so that stretch is worked
+    out in one step, and a nucleotide limited reaction returns straight away. Answers agree with simulate_pcr()
+    to floating point rounding. Parameters are rounded to 'digits' significant figures and results kept in an
+    LRU cache, see pcr_yield.cache_info() for hits and misses and pcr_yield.cache_clear() to reset it.
+    """
+    return _pcr_yield(_quantize(starting_M, digits), int(cycles), *[_quantize(value, digits) for value in
+                      (annealing_sec, length, units, gc_product, m_nucleotides)])
+
+
+pcr_yield.cache_info = _pcr_yield.cache_info
+pcr_yield.cache_clear = _pcr_yield.cache_clear
+
+
+_DIGITS = np.full(256, 4, dtype=np.uint8)  # ASCII -> 2 bit base (A, C, G, T = 0-3), 4 for anything else
+for _digit, _base in enumerate(b"ACGT"):
+    _DIGITS[_base] = _DIGITS[_base + 32] = _digit
+_LETTERS = np.frombuffer(_BASES, dtype=np.uint8)
+_COMPLEMENT = bytes.maketrans(b"ACGTNacgtn", b"TGCANtgcan")
+
+# 'forward' is the primer binding the plus strand (at 'start'), 'reverse' the one binding the minus strand (at 'end')
+Amplicon = namedtuple("Amplicon", ["contig", "start", "end", "forward", "reverse", "mismatches", "sequence", "length",
+                                   "gc_content", "molar_mass"])
+PrimerSite = namedtuple("PrimerSite", ["contig", "start", "end", "strand", "mismatches"])
+
+
+def _reverse_complement(sequence):
+    return sequence.translate(_COMPLEMENT)[::-1]
+
+
+class KmerIndex:
+    """k-mer seed index of a FASTA template for finding primer binding sites, built once and kept on disk.
+
+    Every k-mer of every contig is packed into a 2 bit code and sorted, so the k bases at a primer's 3' end are
+    found with a binary search. Only the plus strand is indexed: minus strand sites are found by looking up the
+    reverse complement of the seed. Hits are then checked against the rest of the primer, allowing up to
+    'max_mismatches' in the 5' part. The index is saved as '<path>.k<k>.npz' and reused while it is newer than the
+    FASTA file. k can be at most 16.
+    """
+
+    def __init__(self, path, k=12, rebuild=False):
+        if not 1 <= k <= 16:
+            raise ValueError("k must be between 1 and 16")
+        self.path, self.k = path, k
+        index_path = f"{path}.k{k}.npz"
+        if not rebuild and os.path.isfile(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(path):
+            with np.load(index_path) as saved:
+                self.names = saved["names"].tolist()
+                self.starts, self.lengths = saved["starts"], saved["lengths"]
+                self.digits, self.codes, self.positions = saved["digits"], saved["codes"], saved["positions"]
+        else:
+            self._build()
+            try:
+                np.savez(index_path, names=np.array(self.names), starts=self.starts, lengths=self.lengths,
+                         digits=self.digits, codes=self.codes, positions=self.positions)
+            except OSError:
+                pass
+        self._order = {name: i for i, name in enumerate(self.names)}
+
+    def _build(self):
+        with FastaIndex(self.path) as fasta:
+            self.names = list(fasta.contigs)
+            self.lengths = np.array([fasta.contigs[name].length for name in self.names], dtype=np.int64)
+            # Contigs back to back with one unknown base between them, so no k-mer spans two contigs
+            self.starts = np.r_[0, np.cumsum(self.lengths + 1)[:-1]].astype(np.int64)
+            self.digits = np.full(int(self.lengths.sum() + len(self.names)), 4, dtype=np.uint8)
+            for name, start, length in zip(self.names, self.starts, self.lengths):
+                self.digits[start:start + length] = _DIGITS[np.frombuffer(fasta.fetch(name).encode(), dtype=np.uint8)]
+        windows = len(self.digits) - self.k + 1
+        if windows <= 0:
+            self.codes, self.positions = np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int64)
+            return
+        codes = np.zeros(windows, dtype=np.uint32)
+        for j in range(self.k):
+            codes = codes << 2 | (self.digits[j:j + windows] & 3)
+        unknown = np.r_[0, np.cumsum(self.digits == 4)]
+        positions = np.flatnonzero(unknown[self.k:] == unknown[:windows])  # Windows without an unknown base
+        order = np.argsort(codes[positions], kind="stable")
+        self.codes, self.positions = codes[positions][order], positions[order]
+
+    def _seed_hits(self, seed):
+        digits = _DIGITS[np.frombuffer(seed.encode(), dtype=np.uint8)]
+        if (digits == 4).any():
+            raise ValueError(f"The {self.k} bases at a primer's 3' end must be A, C, G or T")
+        code = 0
+        for digit in digits.tolist():
+            code = code << 2 | digit
+        code = np.uint32(code)  # A Python int would make searchsorted convert the whole array first
+        return self.positions[np.searchsorted(self.codes, code):np.searchsorted(self.codes, code, side="right")]
+
+    def _check(self, starts, digits):
+        """Mismatches of every site starting at 'starts' against primer 'digits', a large number where a site
+        runs off a contig."""
+        if not len(starts) or not len(digits):
+            return np.zeros(len(starts), dtype=np.int64)
+        inside = (starts >= 0) & (starts + len(digits) <= len(self.digits))
+        window = self.digits[np.clip(starts, 0, len(self.digits) - len(digits))[:, None] + np.arange(len(digits))]
+        mismatches = np.count_nonzero(window != digits, axis=1)
+        mismatches[~inside | (window == 4).any(axis=1)] = len(digits) + 1
+        return mismatches
+
+    def sites(self, primer, max_mismatches=2) -> list:
+        """PrimerSites where 'primer' binds on either strand, its 3' k bases exactly and the rest with at most
+        'max_mismatches' mismatches. Coordinates are 0-based and end exclusive, on the plus strand."""
+        primer = primer.upper()
+        if len(primer) < self.k:
+            raise ValueError(f"Primer {primer} is shorter than the index's k ({self.k})")
+        tail = len(primer) - self.k
+        hits = []
+        # Plus strand: the primer reads left to right, so its 3' seed is the last k bases of the site
+        plus = self._seed_hits(primer[tail:]) - tail
+        plus_mismatches = self._check(plus, _DIGITS[np.frombuffer(primer[:tail].encode(), dtype=np.uint8)])
+        # Minus strand: the site reads as the reverse complement, seed first
+        reverse = _reverse_complement(primer)
+        minus = self._seed_hits(reverse[:self.k])
+        minus_mismatches = self._check(minus + self.k,
+                                       _DIGITS[np.frombuffer(reverse[self.k:].encode(), dtype=np.uint8)])
+        for strand, starts, mismatches in (("+", plus, plus_mismatches), ("-", minus, minus_mismatches)):
+            keep = mismatches <= max_mismatches
+            contigs = np.searchsorted(self.starts, starts[keep], side="right") - 1
+            for contig, start, count in zip(contigs.tolist(), starts[keep].tolist(), mismatches[keep].tolist()):
+                offset = int(self.starts[contig])
+                hits.append(PrimerSite(self.names[contig], start - offset, start - offset + len(primer), strand, count))
+        return sorted(hits, key=lambda site: (self._order[site.contig], site.start))
+
+    def amplify(self, forward, reverse, max_length=5000, max_mismatches=2) -> list:
+        """Amplicons a primer pair would make, as Amplicons sorted by position.
+
+        A product needs one primer on the plus strand and the other downstream of it on the minus strand, within
+        'max_length' bases. The sequence starts with one primer and ends with the other's reverse complement, since
+        that is what gets copied even where they mismatch the template.
+        """
+        forward, reverse = forward.upper(), reverse.upper()
+        sites = {primer: self.sites(primer, max_mismatches) for primer in {forward, reverse}}
+        amplicons = []
+        for left, right in ((forward, reverse), (reverse, forward)):
+            rights = sorted(((self._order[site.contig], site.end), site) for site in sites[right] if site.strand == "-")
+            keys = [key for key, _ in rights]
+            for site in sites[left]:
+                if site.strand != "+":
+                    continue
+                contig = self._order[site.contig]
+                # Minus strand sites ending within max_length of this one, and not starting before it
+                for _, other in rights[bisect_right(keys, (contig, site.start)):
+                                       bisect_right(keys, (contig, site.start + max_length))]:
+                    if other.start >= site.start:
+                        amplicons.append(self._amplicon(site, other, left, right))
+            if forward == reverse:
+                break
+        return sorted(amplicons, key=lambda amplicon: (self._order[amplicon.contig], amplicon.start))
+
+    def _amplicon(self, left_site, right_site, left, right):
+        offset = int(self.starts[self._order[left_site.contig]])
+        if right_site.start >= left_site.end:
+            inner = self.digits[offset + left_site.end:offset + right_site.start]
+            sequence = left + _LETTERS[inner].tobytes().decode() + _reverse_complement(right)
+        else:  # Primers overlap, the product is just the stretch between their outer ends
+            sequence = left + _reverse_complement(right)[left_site.end - right_site.start:]
+        counts = np.bincount(_DIGITS[np.frombuffer(sequence.encode(), dtype=np.uint8)], minlength=5)
+        counts = dict(zip(_BASES.decode(), counts.tolist()))
+        gc_content, molar_mass = _molar_mass(counts)
+        return Amplicon(left_site.contig, left_site.start, right_site.end, left, right,
+                        left_site.mismatches + right_site.mismatches, sequence, len(sequence), gc_content, molar_mass)
+
+
+def in_silico_pcr(template, primer_pairs, max_length=5000, max_mismatches=2, k=12) -> dict:
+    """Finds the products of every (forward, reverse) primer pair on a template FASTA, as {pair: [Amplicon, ...]}.
+
+    'template' is a FASTA path or a KmerIndex. The index is built once and saved next to the file for next time.
+    Pass an Amplicon's length and gc_content straight to simulate_pcr(), or use simulate_amplicon().
+    """
+    index = template if isinstance(template, KmerIndex) else KmerIndex(template, k)
+    return {(forward, reverse): index.amplify(forward, reverse, max_length, max_mismatches)
+            for forward, reverse in primer_pairs}
+
+
+def simulate_amplicon(amplicon, starting_M, **kwargs) -> float:
+    """simulate_pcr() for an Amplicon from in_silico_pcr(), with its length and GC content filled in."""
+    kwargs.setdefault("plot", False)
+    return simulate_pcr(starting_M, length=amplicon.length, gc_product=amplicon.gc_content, **kwargs)
+
+
 if __name__ == "__main__":
     file = "C:\\Users\\CRoots\\Downloads\\adp1-genome-nc_005966.fasta"
-    _, template_molar_mass = get_gc_content(file, verbose=False)
+    with FastaIndex(file) as genome:
+        template_molar_mass = genome.stats().molar_mass
     print(template_molar_mass)
     sequence = "gtgctactcctgtctgaccccaaccatatccgataaatggtttatgaaatacagcttttaataattgaggccaaatttcaaaccgagaagatcccatagtaagacgatcaaacgtagaatagctatttttttgaaaaaaaattaaattaaatagtaatggaacacaataaactaatgtccaaaatacaatattgaaaaaaataactcttcttaattctatctttttttgaaattttaaaagatataatagagaaatcagaattacacttatccatgcacttctagactgcgtcattacattagcaaaaatcaaacaaaaagataaaatattaaataccatattatttaaactatttttttctcttaaatagcataatagaaataaagttattaaaatcaaagtcgaaaattgatttggttgacccagattagcagtagaacgaccattatatgaggagctaaatagaaaaaaattttgaactatttctattttttgatttatagcaataagaaatgaaatctgaaccacaataataaaaatccaagcaatcttttttactattaggtcatcaccatttaatctttcattaaaacctaaaagaaaactcagaaatagaattactaaaaatgaaattgaaaagaaaaaatcttggaaaaaataaatctcacctacaattaactgaataaaaattatgaatatgacaaataagaaccagtaaaaatttttaggaattagaatttttttataatcaaaggacttcacagttagcaatattagcaaacctaaaactgcaattagctctttatataaagtagaagataaatttgaagtatttggaattataaaagcactaccaaggaaaaatacaccagaaactatcgtgtaatttttgatttttttaaaaatactattcattttttataatttaaagaagaacttataaaagttcttcttttaaagccatatagtactactatcaaccacgacattctgatggtacatattttttatca"
     _, product_molar_mass = get_gc_content(sequence, verbose=False)
@@ -112,3 +706,9 @@ if __name__ == "__main__":
     ending_g = ending_M*product_molar_mass
     ending_concentration = ending_g*1000000000/50
     print(f"Simulated resulting PCR concentration: {ending_concentration}ng/ul")
+    # Or find the product on the genome from its primers and simulate that
+    forward, reverse = sequence[:20], _reverse_complement(sequence[-20:])
+    for amplicon in in_silico_pcr(file, [(forward, reverse)])[(forward, reverse)]:
+        ending_g = simulate_amplicon(amplicon, starting_M)*amplicon.molar_mass
+        print(f"{amplicon.contig}:{amplicon.start+1}-{amplicon.end} ({amplicon.length} bp, {amplicon.mismatches} "
+              f"mismatches): {ending_g*1000000000/50}ng/ul")
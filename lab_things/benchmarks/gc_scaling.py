@@ -0,0 +1,66 @@
+"""
+Shows how count_bases_parallel() scales with core count against the serial count_bases() on a synthetic genome.
+
+    python gc_scaling.py --size-mb 500 --workers 1 2 4 8
+
+Pass --fasta to time a real file instead. Every parallel run is checked against the serial counts.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PCR_Simulation import count_bases, count_bases_parallel  # noqa: E402
+
+
+def write_genome(path, size_mb, contigs=20, line_width=80, seed=0):
+    """Writes a seeded random FASTA of about 'size_mb' megabytes split into 'contigs' records."""
+    rng = np.random.default_rng(seed)
+    alphabet = np.frombuffer(b"ACGTacgtN", dtype=np.uint8)
+    contig_length = size_mb * 1_000_000 // contigs
+    with open(path, "wb") as f:
+        for contig in range(contigs):
+            f.write(f">contig_{contig}\n".encode())
+            bases = alphabet[rng.integers(0, len(alphabet), contig_length)]
+            full_lines = contig_length // line_width
+            newlines = np.full((full_lines, 1), ord("\n"), dtype=np.uint8)
+            f.write(np.hstack([bases[:full_lines * line_width].reshape(full_lines, line_width), newlines]).tobytes())
+            if contig_length % line_width:
+                f.write(bases[full_lines * line_width:].tobytes() + b"\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fasta", help="time this file instead of a synthetic genome")
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--shard-mb", type=int, default=64)
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.fasta
+        if path is None:
+            path = os.path.join(tmp, "genome.fa")
+            write_genome(path, args.size_mb)
+        size_mb = os.path.getsize(path) / 1e6
+        start = time.perf_counter()
+        expected = count_bases(path)
+        serial = time.perf_counter() - start
+        print(f"{size_mb:.0f} MB, {os.cpu_count()} cores")
+        print(f"{'workers':>8} {'seconds':>8} {'MB/s':>8} {'speedup':>8}")
+        print(f"{'serial':>8} {serial:8.2f} {size_mb / serial:8.0f} {1:8.2f}")
+        for workers in args.workers:
+            start = time.perf_counter()
+            counts = count_bases_parallel(path, workers=workers, shard_size=args.shard_mb << 20)[path]
+            elapsed = time.perf_counter() - start
+            if counts != expected:
+                raise AssertionError(f"{workers} workers counted {counts}, serial counted {expected}")
+            print(f"{workers:>8} {elapsed:8.2f} {size_mb / elapsed:8.0f} {serial / elapsed:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Cold-start import budget for the lab_things modules, measured with 'python -X importtime'.
+
+    python import_time.py            # check every module against its budget
+    python import_time.py --scale 2  # same, with every budget doubled for slow machines
+
+Each module is imported in a fresh interpreter a few times and the fastest run is compared against its budget.
+It also fails if a module pulls in a dependency it is meant to leave until a function needs it.
+Exits non-zero if anything is over, so it can gate CI.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+LAB_THINGS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module: (budget in ms, modules that must not be imported yet)
+BUDGETS = {
+    "codon_optimizer": (60, ["numpy", "pkg_resources", "concurrent.futures"]),
+    "PCR_Simulation": (250, ["matplotlib", "pandas", "concurrent.futures"]),
+    "thermocycler": (40, ["PIL", "numpy"]),
+}
+
+
+def import_time(module, repeats=5):
+    """Fastest cumulative import time of 'module' in ms across fresh interpreters, and which modules it loaded."""
+    best, loaded = None, []
+    check = f"import {module}, sys, json; print(json.dumps(sorted(sys.modules)))"
+    for _ in range(repeats):
+        run = subprocess.run([sys.executable, "-X", "importtime", "-c", check], cwd=LAB_THINGS,
+                             capture_output=True, text=True, check=True)
+        for line in run.stderr.splitlines():  # import time: self [us] | cumulative | imported package
+            fields = [field.strip() for field in line.split("|")]
+            if len(fields) == 3 and fields[2] == module:
+                elapsed = int(fields[1]) / 1000
+                best = elapsed if best is None else min(best, elapsed)
+        loaded = json.loads(run.stdout)
+    return best, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS))
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget by this")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+    failures = 0
+    print(f"{'module':<20} {'ms':>8} {'budget':>8}")
+    for module in args.modules:
+        budget, deferred = BUDGETS[module]
+        budget *= args.scale
+        elapsed, loaded = import_time(module, args.repeats)
+        eager = [name for name in deferred if name in loaded]
+        status = "ok" if elapsed <= budget and not eager else "OVER"
+        failures += status != "ok"
+        print(f"{module:<20} {elapsed:8.1f} {budget:8.0f}  {status}" + (f" (imports {', '.join(eager)})" if eager else ""))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+Throughput and peak memory baseline for lab_things, on seeded synthetic workloads.
+
+    python suite.py --size small -o results.json                     # quick run, a few seconds per benchmark
+    python suite.py --size large -o nightly.json                     # 2 GB genome, 100k ORFs, ...
+    python suite.py --size small --compare results.json              # flag regressions against a stored run
+    python suite.py --only gc_content weighted_optimize --genome-mb 50
+
+Inputs (a FASTA genome, a protein library, PCR parameter grids, thermocycler programs and long tip/transfer
+protocols on stand-in labware) are generated from --seed, so runs on the same machine are comparable. Each
+benchmark runs in its own fresh process and the fastest of --repeats runs is kept. Memory is reported as the RSS
+once the benchmark's inputs are built (input_rss_mb) and the peak on top of that while it runs (peak_rss_mb), so
+the inputs don't drown out the code being measured. With --compare, any benchmark whose throughput drops, or peak
+RSS grows, by more than --tolerance is listed and the exit code is 1, so it can gate CI.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+import numpy as np
+
+LAB_THINGS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, LAB_THINGS)
+sys.path.insert(0, os.path.join(LAB_THINGS, "opentrons_snippets"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from gc_scaling import write_genome  # noqa: E402
+
+SIZES = {
+    "small": {"genome_mb": 1, "orfs": 1_000, "pcr_runs": 1_000, "grid": 100, "programs": 20, "tips": 2_000,
+              "transfers": 10_000, "primer_pairs": 100},
+    "medium": {"genome_mb": 100, "orfs": 10_000, "pcr_runs": 10_000, "grid": 400, "programs": 200, "tips": 20_000,
+               "transfers": 100_000, "primer_pairs": 1_000},
+    "large": {"genome_mb": 2_000, "orfs": 100_000, "pcr_runs": 100_000, "grid": 1_000, "programs": 1_000,
+              "tips": 200_000, "transfers": 1_000_000, "primer_pairs": 10_000},
+}
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+# Workload generators
+
+def write_proteome(path, orfs, seed=0, min_length=100, max_length=600):
+    """Writes a seeded FASTA of 'orfs' random proteins, each starting with M and ending with a stop (*)."""
+    rng = np.random.default_rng(seed)
+    alphabet = np.frombuffer(AMINO_ACIDS.encode(), dtype=np.uint8)
+    with open(path, "w") as f:
+        for i, length in enumerate(rng.integers(min_length, max_length, orfs)):
+            f.write(f">orf_{i}\nM{alphabet[rng.integers(0, len(alphabet), length - 2)].tobytes().decode()}*\n")
+
+
+def pcr_grid(size, seed=0):
+    """size x size grid of (starting concentration, annealing time) with seeded product lengths and GC contents."""
+    rng = np.random.default_rng(seed)
+    starting_M, annealing_sec = np.meshgrid(np.logspace(-12, -8, size), np.linspace(10, 60, size))
+    return {"starting_M": starting_M, "annealing_sec": annealing_sec,
+            "length": rng.integers(200, 5000, starting_M.shape), "gc_product": rng.uniform(.35, .65, starting_M.shape)}
+
+
+def thermocycler_programs(n, seed=0):
+    """'n' seeded program strings, with one to three cycling stages each."""
+    rng = np.random.default_rng(seed)
+    programs = []
+    for _ in range(n):
+        stages = " ".join(f"{rng.integers(25, 40)}[ 98/0:{rng.integers(10, 30)} {rng.integers(50, 68)}/0:"
+                          f"{rng.integers(10, 30)} 72/{rng.integers(0, 3)}:{rng.integers(10, 59)} ]"
+                          for _ in range(rng.integers(1, 4)))
+        programs.append(f"98/0:30 {stages} 72/5 4/0:00")
+    return programs
+
+
+class _Well:
+    """Stand-in for an Opentrons Well, enough for the tip and liquid helpers."""
+
+    def __init__(self, parent, name):
+        self.parent, self.well_name, self.has_tip = parent, name, True
+
+    def __str__(self):
+        return f"{self.well_name} of {self.parent}"
+
+
+class _Labware:
+    """Stand-in 8 x 12 (or 16 x 24) Opentrons labware."""
+
+    def __init__(self, name, rows=8, columns=12):
+        self.name = name
+        self._columns = [[_Well(self, f"{chr(65 + r)}{c + 1}") for r in range(rows)] for c in range(columns)]
+
+    def columns(self):
+        return self._columns
+
+    def wells(self):
+        return [well for column in self._columns for well in column]
+
+    def __str__(self):
+        return self.name
+
+
+# Benchmarks. Each takes the generated inputs and returns (amount of work, unit, function to time).
+
+def bench_gc_content(inputs):
+    from PCR_Simulation import get_gc_content
+    return os.path.getsize(inputs["genome"]) / 1e6, "MB/s", lambda: get_gc_content(inputs["genome"])
+
+
+def bench_gc_content_parallel(inputs):
+    from PCR_Simulation import get_gc_content
+    workers = os.cpu_count() or 1
+    return os.path.getsize(inputs["genome"]) / 1e6, "MB/s", lambda: get_gc_content(inputs["genome"], workers=workers)
+
+
+def _proteins(inputs):
+    from codon_optimizer import read_fasta
+    return [sequence for _, sequence in read_fasta(inputs["proteome"])]
+
+
+def bench_weighted_optimize(inputs):
+    from codon_optimizer import weighted_optimize
+    proteins = _proteins(inputs)
+    return sum(map(len, proteins)), "residues/s", \
+        lambda: [weighted_optimize(protein, "drosophila", seed=i) for i, protein in enumerate(proteins)]
+
+
+def bench_hard_optimize(inputs):
+    from codon_optimizer import hard_optimize
+    proteins = _proteins(inputs)
+    return sum(map(len, proteins)), "residues/s", lambda: [hard_optimize(protein, "drosophila") for protein in proteins]
+
+
+def bench_codon_scoring(inputs):
+    from codon_optimizer import hard_optimize
+    from codon_scoring import score_batch
+    genes = [hard_optimize(protein, "drosophila") for protein in _proteins(inputs)]
+    return sum(map(len, genes)) // 3, "codons/s", lambda: score_batch(genes, "drosophila")
+
+
+def bench_simulate_pcr(inputs):
+    from PCR_Simulation import simulate_pcr
+    grid = pcr_grid(int(np.sqrt(inputs["pcr_runs"])) or 1, inputs["seed"])
+    runs = list(zip(*(grid[key].ravel() for key in ("starting_M", "annealing_sec", "length", "gc_product"))))
+    return len(runs), "runs/s", lambda: [simulate_pcr(c, annealing_sec=t, length=n, gc_product=gc, plot=False)
+                                         for c, t, n, gc in runs]
+
+
+def bench_simulate_pcr_grid(inputs):
+    from PCR_Simulation import simulate_pcr_grid
+    grid = pcr_grid(inputs["grid"], inputs["seed"])
+    return grid["starting_M"].size, "runs/s", lambda: simulate_pcr_grid(**grid)
+
+
+def bench_pcr_image(inputs):
+    from thermocycler import pcr_image
+    programs = thermocycler_programs(inputs["programs"], inputs["seed"])
+    path = os.path.join(inputs["tmp"], "program.png")
+    return len(programs), "images/s", lambda: [pcr_image(program, path, show=False) for program in programs]
+
+
+def bench_tip_tracker(inputs):
+    from tip_tracker import TipTracker
+
+    def run():
+        tracker = TipTracker(_Labware(f"rack {i}") for i in range(-(-inputs["tips"] // 96)))
+        while tracker.pick(8):  # Empty every rack with a multi-channel, then again with a single channel
+            pass
+        tracker.refill()
+        while tracker.pick(1):
+            pass
+    return 2 * inputs["tips"], "tips/s", run
+
+
+def bench_transfer_plan(inputs):
+    from falcon_liquid_tracking import falcon_tube_50, plan_transfers  # Needs opentrons installed
+
+    class Pipette:
+        max_volume, min_volume = 300, 20
+    plates = [_Labware(f"plate {i}") for i in range(-(-inputs["transfers"] // 96))]
+    jobs = [(None, well, 20) for plate in plates for well in plate.wells()][:inputs["transfers"]]
+
+    def run():
+        tubes = [falcon_tube_50(None, 50_000, _Well(None, f"tube {i}")) for i in range(-(-len(jobs) // 2000))]
+        return plan_transfers([(tubes[i // 2000], well, volume) for i, (_, well, volume) in enumerate(jobs)],
+                              Pipette(), disposal_volume=20)
+    return len(jobs), "transfers/s", run
+
+
+def bench_liquid_inventory(inputs):
+    from liquid_inventory import LiquidInventory
+    rng = np.random.default_rng(inputs["seed"])
+    plates = [_Labware(f"plate {i}", 16, 24) for i in range(4)]
+    wells = [well for plate in plates for well in plate.wells()]
+    picks = rng.integers(0, len(wells), (inputs["transfers"], 2))
+    batches = [[(wells[s], wells[d], 1.0) for s, d in chunk] for chunk in np.array_split(picks, max(1, len(picks) // 384))]
+
+    def run():
+        inventory = LiquidInventory()
+        for plate in plates:
+            inventory.register(plate, 10_000, maximum=20_000)
+        for batch in batches:
+            inventory.apply(batch)
+    return len(picks), "transfers/s", run
+
+
+def bench_geometry_levels(inputs):
+    from container_geometry import get_profile
+    profile = get_profile("falcon_50ml")
+    volumes = np.random.default_rng(inputs["seed"]).uniform(1_000, 50_000, inputs["transfers"])
+    scalar = volumes[:10_000].tolist()
+    return len(volumes) + len(scalar), "lookups/s", lambda: (profile.levels(volumes), [profile.level(v) for v in scalar])
+
+
+def bench_in_silico_pcr(inputs):
+    from PCR_Simulation import KmerIndex, _reverse_complement, in_silico_pcr
+    # A bacterial sized template whatever the preset, the index is built (untimed) before the searches
+    template = os.path.join(inputs["tmp"], "template.fa")
+    write_genome(template, 5, contigs=2, seed=inputs["seed"])
+    index = KmerIndex(template)
+    rng = np.random.default_rng(inputs["seed"])
+    sequence = np.frombuffer(b"ACGTN", dtype=np.uint8)[index.digits].tobytes().decode()
+    pairs = []
+    while len(pairs) < inputs["primer_pairs"]:
+        start = int(rng.integers(0, len(sequence) - 2_000))
+        forward, reverse = sequence[start:start + 20], sequence[start + 1_000:start + 1_022]
+        if "N" not in forward + reverse:
+            pairs.append((forward, _reverse_complement(reverse)))
+    return len(pairs), "pairs/s", lambda: in_silico_pcr(index, pairs)
+
+
+BENCHMARKS = {name[len("bench_"):]: function for name, function in globals().items() if name.startswith("bench_")}
+
+
+def _rss_mb(field="VmHWM"):
+    """Peak ("VmHWM") or current ("VmRSS") RSS of this process, None where it can't be read."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Only the peak, which is the closest there is
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3  # Bytes on macOS, kB elsewhere
+
+
+def _reset_peak_rss():
+    """Starts the peak RSS over from the current RSS (Linux), returns False where that isn't possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _run(name, inputs, repeats):
+    """Runs one benchmark in this (fresh) process, returning its result record."""
+    try:
+        work, unit, function = BENCHMARKS[name](inputs)
+    except ImportError as error:
+        return {"skipped": str(error)}
+    gc.collect()
+    # Without a reset the peak includes building the inputs, the best there is then is the growth past that peak
+    input_rss = _rss_mb("VmRSS") if _reset_peak_rss() else _rss_mb()
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak_rss = _rss_mb()
+    return {"work": work, "seconds": best, "throughput": work / best, "unit": unit, "input_rss_mb": input_rss,
+            "peak_rss_mb": None if peak_rss is None or input_rss is None else max(peak_rss - input_rss, 0.0)}
+
+
+def run_suite(names, sizes, seed=0, repeats=3):
+    """Generates the inputs into a temporary folder and runs each benchmark in its own process."""
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = dict(sizes, seed=seed, tmp=tmp, genome=os.path.join(tmp, "genome.fa"),
+                      proteome=os.path.join(tmp, "proteome.fa"))
+        if any(name.startswith("gc_content") for name in names):
+            write_genome(inputs["genome"], sizes["genome_mb"], seed=seed)
+        if any(name.endswith("_optimize") or name == "codon_scoring" for name in names):
+            write_proteome(inputs["proteome"], sizes["orfs"], seed=seed)
+        results = {}
+        for name in names:
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                results[name] = pool.submit(_run, name, inputs, repeats).result()
+            result = results[name]
+            if "skipped" in result:
+                print(f"{name:>22}  skipped: {result['skipped']}", file=sys.stderr)
+            else:
+                rss, input_rss = ("?" if result[key] is None else f"{result[key]:.0f}"
+                                   for key in ("peak_rss_mb", "input_rss_mb"))
+                print(f"{name:>22} {result['seconds']:9.3f} s {result['throughput']:12.4g} {result['unit']:<12}"
+                      f" {rss:>6} MB (+{input_rss} MB inputs)", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance=.15):
+    """Benchmarks that got slower, or use more memory, than 'baseline' by more than 'tolerance', as messages."""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old or "skipped" in result or "skipped" in old:
+            continue
+        if result["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['throughput']:.4g} {result['unit']}, "
+                               f"was {old['throughput']:.4g} ({result['throughput'] / old['throughput'] - 1:+.0%})")
+        if "input_rss_mb" not in old:  # From before inputs were measured apart, its peaks aren't comparable
+            continue
+        if result["peak_rss_mb"] and old["peak_rss_mb"] and result["peak_rss_mb"] > old["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {result['peak_rss_mb']:.0f} MB, was {old['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=SIZES, default="small", help="workload preset")
+    for key, value in SIZES["small"].items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=int, help=f"override the preset (small: {value})")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS), metavar="NAME",
+                        help=f"benchmarks to run, from: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("-o", "--output", help="write results as JSON here (default stdout)")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON from an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=.15, help="allowed slowdown/RSS growth (default .15)")
+    args = parser.parse_args(argv)
+
+    sizes = {key: getattr(args, key) or value for key, value in SIZES[args.size].items()}
+    report = {
+        "meta": {"date": datetime.now(timezone.utc).isoformat(timespec="seconds"), "size": args.size, "sizes": sizes,
+                 "seed": args.seed, "python": platform.python_version(), "platform": platform.platform(),
+                 "cpu_count": os.cpu_count(), "numpy": np.__version__},
+        "results": run_suite(args.only, sizes, args.seed, args.repeats),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("sizes") != sizes:
+            print("Warning: the baseline was run with different workload sizes", file=sys.stderr)
+        regressions = compare(report["results"], baseline["results"], args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+'''
+Codon harmonization: recodes a native gene for another organism while keeping its translation rhythm.
+
+hard_optimize() and weighted_optimize() start from the protein, so a codon the source organism uses rarely (and
+translates slowly, which can matter for folding) gets no special treatment. harmonize() starts from the CDS instead:
+each codon is ranked by how often the source organism uses it among the codons for its amino acid, and replaced by the
+target codon of the same relative rank. The most common source codon becomes the most common target codon, the rarest
+becomes the rarest, and ones in between land in between.
+
+harmonize(): One CDS
+harmonize_batch(): A list of CDS in one pass
+harmonize_many(): A FASTA file or iterable of (name, CDS) pairs, streamed a batch at a time
+
+Each source/target table pair is compiled once into a 65 entry codon-to-codon array (see
+codon_optimizer.codon_number()), so recoding is a single NumPy gather over every codon of a batch. Codons are
+translated with the standard genetic code, so a misfiled codon in a table can't change the protein. Codons with
+ambiguous bases and any trailing partial codon are left as they are.
+
+Requires NUMPY
+
+'''
+
+from functools import lru_cache
+
+import numpy as np
+
+if __package__:
+    from .codon_optimizer import get_table, read_fasta
+    from .codon_scoring import encode_codons
+    from .codon_table_builder import _STANDARD_CODE
+else:
+    from codon_optimizer import get_table, read_fasta
+    from codon_scoring import encode_codons
+    from codon_table_builder import _STANDARD_CODE
+
+_CODONS = np.array(["".join("ACGT"[n >> shift & 3] for shift in (4, 2, 0)) for n in range(64)] + ["NNN"], dtype="S3")
+
+
+def _ranked(table, aa):
+    """Standard code codons for 'aa', most used in 'table' first. Ties keep the table's order, like hard_optimize()."""
+    codons = [codon for codon, residue in _STANDARD_CODE.items() if residue == aa]
+    usage = table.table.get(aa, {})
+    listed = {codon: i for i, codon in enumerate(usage)}
+    return sorted(codons, key=lambda codon: (-usage.get(codon, 0), listed.get(codon, len(listed)), codon))
+
+
+@lru_cache(maxsize=None)
+def _harmonization_map(source, target):
+    """Codon number -> codon number array taking each source codon to the target codon of the same relative rank."""
+    mapping = np.arange(65, dtype=np.uint8)  # Index 64 (ambiguous codons) maps to itself
+    for aa in set(_STANDARD_CODE.values()):
+        source_ranks = _ranked(source, aa)
+        used = [codon for codon in _ranked(target, aa) if target.table.get(aa, {}).get(codon, 0) > 0]
+        if not used:  # The target table has nothing for this amino acid, keep the source codons
+            continue
+        target_ranks = np.array([encode_codons(codon)[0] for codon in used])
+        for rank, codon in enumerate(source_ranks):
+            relative = rank / (len(source_ranks) - 1) if len(source_ranks) > 1 else 0.0
+            mapping[encode_codons(codon)[0]] = target_ranks[round(relative * (len(target_ranks) - 1))]
+    mapping.flags.writeable = False
+    return mapping
+
+
+def harmonization_map(source, target) -> dict:
+    """{source codon: target codon} that harmonize() uses for a pair of tables, handy for checking by eye."""
+    mapping = _harmonization_map(get_table(source), get_table(target))
+    return {_CODONS[n].decode(): _CODONS[mapping[n]].decode() for n in range(64)}
+
+
+def harmonize_batch(sequences, source, target) -> list:
+    """Harmonizes every CDS in 'sequences' from table 'source' to table 'target' in one pass, returning strings."""
+    mapping = _harmonization_map(get_table(source), get_table(target))
+    sequences = [sequence.encode("ascii") if isinstance(sequence, str) else bytes(sequence) for sequence in sequences]
+    if not sequences:
+        return []
+    encoded = [encode_codons(sequence) for sequence in sequences]
+    codons = np.concatenate(encoded)
+    original = np.frombuffer(b"".join(sequence[:len(sequence) - len(sequence) % 3] for sequence in sequences),
+                             dtype="S3")
+    recoded = np.where(codons == 64, original, _CODONS[mapping[codons]])  # Ambiguous codons stay as written
+    ends = np.cumsum([len(codons) for codons in encoded])
+    return [(part.tobytes() + sequence[len(sequence) - len(sequence) % 3:]).decode("ascii")
+            for part, sequence in zip(np.split(recoded, ends[:-1]), sequences)]
+
+
+def harmonize(cds, source, target) -> str:
+    """Recodes nucleotide 'cds' written for table 'source' so it uses table 'target' codons of the same relative rank."""
+    return harmonize_batch([cds], source, target)[0]
+
+
+def harmonize_many(records, source, target, batch_size=1024):
+    """Yields (name, harmonized CDS) for a FASTA path (optionally .gz), open handle or iterable of (name, CDS) pairs,
+    a batch of 'batch_size' records at a time."""
+    records = read_fasta(records) if isinstance(records, str) or hasattr(records, "read") else iter(records)
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield from zip([name for name, _ in batch], harmonize_batch([s for _, s in batch], source, target))
+            batch = []
+    if batch:
+        yield from zip([name for name, _ in batch], harmonize_batch([s for _, s in batch], source, target))
@@ -3,114 +3,531 @@ Two core scripts for generating codon-optimized sequences.
 
 hard_optimize(): Replaces codons in a sequence with the most common codon for your desired organism
 weighted_optimize(): Uses weighted randomization to generate a codon optimized sequence that still takes advantage of all codons
-                     with at least user defined frequency
+                     with at least user defined frequency. Pass 'seed' to get the same sequence back every time.
                      
 Both functions take protein sequences, not nucleotide, and a codon table in a folder named 'codontables' in the same root directory as
 the script. You can find some examples in this repo.
 
-Requires NUMPY
+Tables are loaded, checked and compiled once per process by get_table() and reused by every later call. Named tables are
+reloaded if their file changes, and dict tables are matched by content so passing the same dict again is just as cheap.
+
+constrained_optimize(): Searches for the most likely codons that avoid forbidden motifs (BsaI/BsmBI sites by default),
+                        long homopolymers and local GC extremes, instead of filtering and re-rolling afterwards.
+
+optimize_many(): Runs any of the optimizers over a whole FASTA file or iterable of proteins across a process pool, streaming
+                 results back in input order. This is also what runs when you call the script from the command line:
+                     python codon_optimizer.py proteins.fasta ecoli -o optimized.fasta --seed 1
+
+To rank the results (or natural genes) by CAI, GC3 and rare codon clusters, see codon_scoring.py.
+
+Requires NUMPY (hard_optimize() and constrained_optimize() run without it)
 
 @author: croots
 @version: 0.1
 
 '''
 
-from numpy.random import choice
+# Only light standard library imports up here, numpy and the rest are imported by the functions that use them so
+# quick scripts that only call hard_optimize() start fast. benchmarks/import_time.py keeps an eye on this.
 from warnings import warn
-from pkg_resources import resource_filename
-from os import listdir, path
+from os import path, cpu_count
+from pathlib import Path
+from collections import deque
+from functools import lru_cache
+from math import log
+from types import MappingProxyType
+from threading import Lock
+import hashlib
+import heapq
 import json
+import sys
 from itertools import product, chain
 
 
+def _table_dir():
+    """Folder of bundled codon tables, found through importlib.resources when imported as part of a package."""
+    if __package__:
+        from importlib.resources import files
+        return files(__package__) / 'codontables'
+    return Path(__file__).parent / 'codontables'
+
+
 def available_tables(info="all") -> list:  # Should be easy to follow
     '''Returns list of available codontables as [organism, type, name_for_use]'''
-    table_loc = resource_filename(__name__, 'codontables')
-    tables = listdir(table_loc)
+    tables = sorted((table for table in _table_dir().iterdir() if table.name.endswith(".json")), key=lambda table: table.name)
     table_list = []
     for table in tables:
-        with open(table_loc + "/" + table) as f:
-            table_contents = json.load(f)
         if info == "all":
+            table_contents = json.loads(table.read_text())
             table_info = [table_contents["meta"]["name"],
                           table_contents["meta"]["type"],
-                          path.splitext(table)[0]]
+                          path.splitext(table.name)[0]]
         elif info == "usage_name":
-            table_info = path.splitext(table)[0]
+            table_info = path.splitext(table.name)[0]
         else:
             raise ValueError(f"Table info type '{info} unrecognized")
         table_list.append(table_info)
     return table_list
 
 
-def _table_prep(table):
-    """Takes user input table and ensures it's valid for future use."""
-    codon_tables = available_tables(info="usage_name")
-    if type(table) == dict:  # Allows user to set a manual table
-        pass
-    elif table in codon_tables:  # Grabs a predefined table otherwise
-        table_loc = resource_filename(__name__, 'codontables')
-        with open(table_loc + "/" + table + ".json") as f:
-            table_contents = json.load(f)
-        table = table_contents["table"]
-    else:
-        raise ValueError("Could not phrase supplied codon table.")
+class CompiledTable:
+    """Validated, read-only codon table with the lookups both optimizers need precomputed.
+
+    Don't build these yourself, get them from get_table() so they are shared through the registry.
+    """
+    __slots__ = ("name", "table", "best", "_variants", "_arrays", "_lock")
+
+    def __init__(self, name, table):
+        self.name = name
+        self.table = MappingProxyType({aa: MappingProxyType(dict(codons)) for aa, codons in table.items()})
+        self.best = MappingProxyType({aa: max(codons, key=codons.get) for aa, codons in table.items() if codons})
+        self._variants = {}
+        self._arrays = None
+        self._lock = Lock()
+
+    def weights(self, avoid_less_than=0):
+        """Returns {aa: (codon array, cumulative weights)} with codons rarer than 'avoid_less_than' dropped.
+
+        Amino acids with no usable codons, or whose weights total more than 1, map to the error message
+        weighted_optimize() raises for them instead. Variants are built once per threshold and kept.
+        """
+        variant = self._variants.get(avoid_less_than)
+        if variant is None:
+            with self._lock:
+                variant = self._variants.get(avoid_less_than)
+                if variant is None:
+                    variant = MappingProxyType({aa: self._filter(aa, avoid_less_than) for aa in self.table})
+                    self._variants[avoid_less_than] = variant
+        return variant
+
+    def codon_arrays(self):
+        """Returns (frequency, adaptiveness, amino acid) arrays indexed by packed codon number (see codon_number()).
+
+        Adaptiveness is each codon's frequency over the most frequent codon for its amino acid, and amino acids are
+        ASCII codes. Index 64 stands for anything that isn't a clean ACGT triplet and is NaN/0. Built once, read-only.
+        """
+        if self._arrays is None:
+            import numpy as np
+            frequency, adaptiveness = np.full(65, np.nan), np.full(65, np.nan)
+            amino_acid = np.zeros(65, dtype=np.uint8)
+            for aa, codons in self.table.items():
+                top = max(codons.values(), default=0)
+                for codon, value in codons.items():
+                    frequency[codon_number(codon)] = value
+                    adaptiveness[codon_number(codon)] = value / top if top else 0.0
+                    amino_acid[codon_number(codon)] = ord(aa)
+            for array in (frequency, adaptiveness, amino_acid):
+                array.flags.writeable = False
+            self._arrays = frequency, adaptiveness, amino_acid
+        return self._arrays
+
+    def _filter(self, aa, avoid_less_than):
+        import numpy as np
+        weights = [value if value >= avoid_less_than else 0 for value in self.table[aa].values()]
+        weight_sum = sum(weights)
+        if weight_sum == 0:
+            return f"No usable codons found for {aa}. Consider reducing 'avoid_less_than'."
+        elif weight_sum > 1:
+            return f"Total codon weight for {aa} is greater than 1"
+        codons = np.array([codon for codon, weight in zip(self.table[aa], weights) if weight], dtype="S3")
+        codons.flags.writeable = False
+        cumulative = np.cumsum([weight for weight in weights if weight]) / weight_sum  # Same as padding to 1 and re-rolling
+        cumulative[-1] = 1.0
+        cumulative.flags.writeable = False
+        return codons, cumulative
+
+
+def codon_number(codon) -> int:
+    """Packs a codon into 0-63 as three base-4 digits (A=0, C=1, G=2, T=3, first base most significant), or 64."""
+    try:
+        return sum(4 ** (2 - i) * "ACGT".index(base) for i, base in enumerate(codon.upper())) if len(codon) == 3 else 64
+    except ValueError:
+        return 64
+
+
+_registry = {}  # {key: (mtime_ns or None, CompiledTable)}, shared by the whole process
+_registry_lock = Lock()
+
+
+def _validate(table):
+    """Warns about missing or duplicated codons in a raw {aa: {codon: frequency}} table."""
     all_codons = ["".join(x) for x in [codon for codon in product("ATCG", repeat=3)]]
-    print(all_codons)
     codons_present = list(chain(*[list(table[aa].keys()) for aa in table]))
-    codons_missing = [codon for codon in all_codons if codon not in codons_present]  # Find missing codons
+    present = set(codons_present)
+    codons_missing = [codon for codon in all_codons if codon not in present]  # Find missing codons
     if codons_missing:  # Report them to the user
         warn(f"The following codons were not found in supplied table: {', '.join(codons_missing)}.")
-    duplicate_codons = set([codon for codon in codons_present if codons_present.count(codon) > 1])  # Find dupe codons
-    if duplicate_codons:  # Report them to the user
+    if len(present) != len(codons_present):  # Report dupe codons to the user
+        duplicate_codons = set(codon for codon in present if codons_present.count(codon) > 1)
         warn(f"The following codons appear more than once in the supplied table: {', '.join(duplicate_codons)}.")
-    return table
-
-
-def weighted_optimize(protein, table, avoid_less_than=.15) -> str:
-    """Optimizes string of amino acids 'protein' for organism 'table' by weight of codon frequency."""
-    table = _table_prep(table)
-    result = str()  # Defines resulting nucleotide string variable
-    for i, aa in enumerate(protein):  # Selects nucleotide for every amino acid
-        if i+1 < len(protein) and aa == "*":
-            warn(f"Your protein may have a premature stop at position {i+1} (indexed to 1).")
-        aa = aa.upper()
-        codon_table = table[aa]
-        for key, value in codon_table.items():  # Removes codons of user-defined rarity from the pool
-            if value < avoid_less_than:
-                codon_table[key] = 0
-        elements = list(codon_table.keys())
-        weights = list(codon_table.values())
-        weight_sum = sum(weights)
-        if weight_sum == 0:
-            raise ValueError(f"No usable codons found for {aa}. Consider reducing 'avoid_less_than'.")
-        elif weight_sum < 1:  # Balances codon frequency to total 1 if too low, esp. after removing rare ones
-            weight_delta = 1-weight_sum
-            elements = elements + [""]
-            weights = weights + [weight_delta]
-        elif weight_sum > 1:
-            raise ValueError(f"Total codon weight for {aa} is greater than 1")
-        codon = ""
-        while not codon:  # Actually does the picking
-            codon = choice(elements, p=weights)
-        result = result + codon  # Builds nucleotide string
-    return result
+
+
+def _fingerprint(table):
+    """Content hash of a user supplied table, so equal dicts share one compiled table."""
+    return hashlib.sha1(json.dumps(table, sort_keys=True).encode()).hexdigest()
+
+
+def get_table(table) -> CompiledTable:
+    """Returns the compiled form of a table name or {aa: {codon: frequency}} dict, loading it at most once.
+
+    Named tables are reloaded when their file's modification time changes.
+    """
+    if isinstance(table, CompiledTable):
+        return table
+    elif type(table) == dict:  # Allows user to set a manual table
+        key, mtime, table_file = "dict:" + _fingerprint(table), None, None
+    elif isinstance(table, str):  # Grabs a predefined table otherwise
+        # Only names of bundled tables, so paths like '../x' can't load (and be cached from) anywhere else.
+        # Names already in the registry were checked when they were first loaded.
+        if table not in _registry and table not in available_tables(info="usage_name"):
+            raise ValueError(f"Unknown codon table '{table}', see available_tables()")
+        table_file = _table_dir() / (table + ".json")
+        if not table_file.is_file():
+            raise ValueError("Could not phrase supplied codon table.")
+        mtime = table_file.stat().st_mtime_ns if hasattr(table_file, "stat") else None  # Zipped tables never change
+        key = table
+    else:
+        raise ValueError("Could not phrase supplied codon table.")
+    cached = _registry.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _registry_lock:
+        cached = _registry.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        if table_file is not None:
+            table = json.loads(table_file.read_text())["table"]
+        _validate(table)
+        compiled = CompiledTable(key, table)
+        _registry[key] = (mtime, compiled)
+    return compiled
+
+
+def clear_table_cache():
+    """Drops every compiled table, mostly useful for tests and after editing tables in place."""
+    with _registry_lock:
+        _registry.clear()
+
+
+def _table_prep(table):
+    """Takes user input table and ensures it's valid for future use."""
+    return get_table(table)
+
+
+def _premature_stops(protein):
+    """Warns about every stop codon before the last residue."""
+    for i in [i for i, aa in enumerate(protein[:-1]) if aa == "*"]:
+        warn(f"Your protein may have a premature stop at position {i+1} (indexed to 1).")
+
+
+def _sample_codons(protein, weights, rng):
+    """Draws a codon for every residue of 'protein' from compiled 'weights', a few NumPy calls per amino acid."""
+    import numpy as np
+    residues = np.frombuffer(protein.upper().encode("ascii"), dtype="S1")
+    result = np.empty(len(residues), dtype="S3")
+    for aa in np.unique(residues):  # Inverse-CDF over every position of the same amino acid at once
+        codon_weights = weights[aa.decode()]
+        if isinstance(codon_weights, str):
+            raise ValueError(codon_weights)
+        codons, cumulative = codon_weights
+        positions = np.flatnonzero(residues == aa)
+        picks = cumulative.searchsorted(rng.random(len(positions)), side="right")
+        result[positions] = codons[picks]
+    return result.tobytes().decode("ascii")
+
+
+def weighted_optimize(protein, table, avoid_less_than=.15, seed=None) -> str:
+    """Optimizes string of amino acids 'protein' for organism 'table' by weight of codon frequency.
+
+    'seed' can be an int or a numpy Generator to make the result reproducible.
+    """
+    import numpy as np
+    weights = _table_prep(table).weights(avoid_less_than)
+    _premature_stops(protein)
+    return _sample_codons(protein, weights, np.random.default_rng(seed))
 
 
 def hard_optimize(protein, table) -> str:
     """Optimizes string of amino acids 'protein' for organism 'table' by most frequent codon."""
-    table = _table_prep(table)
-    result = str()
-    for i, aa in enumerate(protein):  # Selects nucleotide for every amino acid
-        if i+1 < len(protein) and aa == "*":
-            warn(f"Your protein may have a premature stop at position {i+1} (indexed to 1).")
-        aa = aa.upper()
-        codon = max(table[aa], key=table[aa].get)
-        result = result + codon  # Builds nucleotide string
-    return result
+    best = _table_prep(table).best
+    _premature_stops(protein)
+    return "".join([best[aa] for aa in protein.upper()])  # Selects nucleotide for every amino acid
+
+
+_COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+def reverse_complement(sequence) -> str:
+    """Reverse complement of an ACGT string."""
+    return sequence.upper().translate(_COMPLEMENT)[::-1]
+
+
+class MotifAutomaton:
+    """Aho-Corasick automaton that flags forbidden motifs on either strand as bases are appended one codon at a time.
+
+    States are plain ints, so a search can carry its position in every motif at once and check a new codon in O(1)
+    instead of rescanning the sequence built so far.
+    """
+
+    def __init__(self, motifs):
+        patterns = set()
+        for motif in motifs:
+            motif = motif.upper()
+            if not motif or set(motif) - set("ACGT"):
+                raise ValueError(f"Forbidden motif '{motif}' must be a non-empty ACGT sequence")
+            patterns.update((motif, reverse_complement(motif)))
+        goto, hit = [{}], [False]
+        for pattern in sorted(patterns):  # Build the trie
+            state = 0
+            for base in pattern:
+                if base not in goto[state]:
+                    goto.append({})
+                    hit.append(False)
+                    goto[state][base] = len(goto) - 1
+                state = goto[state][base]
+            hit[state] = True
+        delta = [dict() for _ in goto]
+        fail = [0] * len(goto)
+        queue = deque([0])
+        while queue:  # Breadth first so every fail link points at an already finished state
+            state = queue.popleft()
+            for base in "ACGT":
+                if base in goto[state]:
+                    child = goto[state][base]
+                    fail[child] = delta[fail[state]][base] if state else 0
+                    hit[child] = hit[child] or hit[fail[child]]
+                    delta[state][base] = child
+                    queue.append(child)
+                else:
+                    delta[state][base] = delta[fail[state]][base] if state else 0
+        self.motifs = tuple(sorted(patterns))
+        self.delta = tuple(delta)
+        self.hit = tuple(hit)
+        self._codon_steps = {}
+
+    def step(self, state, codon):
+        """Returns the state after appending 'codon', or None if that completes a forbidden motif."""
+        key = (state, codon)
+        if key not in self._codon_steps:
+            for base in codon:
+                state = self.delta[state][base]
+                if self.hit[state]:
+                    state = None
+                    break
+            self._codon_steps[key] = state
+        return self._codon_steps[key]
+
+
+@lru_cache(maxsize=32)
+def _automaton(motifs):
+    return MotifAutomaton(motifs)
+
+
+def constrained_optimize(protein, table, forbidden=("GGTCTC", "CGTCTC"), gc_range=(.3, .7), gc_window=50,
+                         max_homopolymer=6, avoid_less_than=.1, beam_width=32) -> str:
+    """Optimizes 'protein' for the most likely codons under 'table' that also satisfy sequence constraints.
+
+    Runs a beam search over codon choices scored by summed log codon frequency, dropping any partial sequence that
+    contains a 'forbidden' motif on either strand (BsaI and BsmBI sites by default) or a run of the same base longer
+    than 'max_homopolymer'. 'gc_window' long stretches with GC outside 'gc_range' are ruled out the same way whenever
+    the protein allows it; where it doesn't (think poly-lysine) the fewest such windows are kept and you get a warning.
+    Partial sequences that can only ever continue the same way are merged, keeping the best scoring one.
+    Pass None to skip a constraint. Raises ValueError if every candidate is ruled out, in which case relax the
+    constraints or raise 'beam_width'.
+    """
+    usage = _table_prep(table).table
+    automaton = _automaton(tuple(forbidden or ()))
+    _premature_stops(protein)
+    options = {}
+    for aa in set(protein.upper()):
+        codons = {codon: value for codon, value in usage[aa].items() if value >= avoid_less_than and value > 0}
+        if not codons:
+            raise ValueError(f"No usable codons found for {aa}. Consider reducing 'avoid_less_than'.")
+        options[aa] = [(codon, log(value)) for codon, value in codons.items()]
+    # Each hypothesis: ((-GC windows missed, score), automaton state, last base, run length, last gc_window bases,
+    # their gc count, codon history as nested (codon, previous history) pairs)
+    beam = [((0, 0.0), 0, "", 0, "", 0, None)]
+    for i, aa in enumerate(protein.upper()):
+        best = {}
+        for (misses, score), state, last, run, tail, gc, history in beam:
+            for codon, weight in options[aa]:
+                new_state = automaton.step(state, codon)
+                if new_state is None:
+                    continue
+                new_misses, new_last, new_run, new_tail, new_gc = misses, last, run, tail, gc
+                for base in codon:
+                    new_run = new_run + 1 if base == new_last else 1
+                    new_last = base
+                    if max_homopolymer is not None and new_run > max_homopolymer:
+                        break
+                    if gc_range is not None:
+                        new_tail += base
+                        new_gc += base in "GC"
+                        if len(new_tail) > gc_window:
+                            new_gc -= new_tail[0] in "GC"
+                            new_tail = new_tail[1:]
+                        if len(new_tail) == gc_window and not gc_range[0] <= new_gc / gc_window <= gc_range[1]:
+                            new_misses -= 1
+                else:
+                    rank = (new_misses, score + weight)
+                    key = (new_state, new_last, new_run if max_homopolymer is not None else 0, new_tail)
+                    if key not in best or best[key][0] < rank:
+                        best[key] = (rank, new_state, new_last, new_run, new_tail, new_gc, (codon, history))
+        if not best:
+            raise ValueError(f"No sequence satisfies the constraints at residue {i+1} ({aa}). "
+                             "Relax the constraints or raise 'beam_width'.")
+        beam = heapq.nlargest(beam_width, best.values(), key=lambda hypothesis: hypothesis[0])
+        survivors = {}  # Also keep the best of every motif/homopolymer state, so one dead end can't empty the beam
+        for hypothesis in best.values():
+            local = hypothesis[1:4]
+            if local not in survivors or survivors[local][0] < hypothesis[0]:
+                survivors[local] = hypothesis
+        kept = set(map(id, beam))
+        beam.extend(hypothesis for hypothesis in survivors.values() if id(hypothesis) not in kept)
+    if beam[0][0][0]:
+        warn(f"{-beam[0][0][0]} windows of {gc_window} bases could not be kept within a GC content of {gc_range}.")
+    codons, history = [], beam[0][6]
+    while history:
+        codon, history = history
+        codons.append(codon)
+    return "".join(reversed(codons))
+
+
+def read_fasta(source):
+    """Yields (name, sequence) for every record in a FASTA file path (optionally .gz) or open text handle."""
+    if isinstance(source, str):
+        import gzip
+        opener = gzip.open if source.endswith(".gz") else open
+        with opener(source, "rt") as f:
+            yield from read_fasta(f)
+        return
+    name, lines = None, []
+    for line in source:
+        line = line.strip()
+        if not line:
+            continue
+        elif line[0] == ">":
+            if name is not None:
+                yield name, "".join(lines)
+            name, lines = line[1:], []
+        elif name is None:
+            raise ValueError("FASTA input must start with a '>' header line")
+        else:
+            lines.append(line)
+    if name is not None:
+        yield name, "".join(lines)
+
+
+def write_fasta(records, handle, width=60):
+    """Writes (name, sequence) records to an open text handle as they arrive, wrapped to 'width'."""
+    for name, sequence in records:
+        handle.write(f">{name}\n")
+        for i in range(0, len(sequence), width):
+            handle.write(sequence[i:i+width] + "\n")
+
+
+_worker = {}  # Per-process optimizer state set up by _start_worker()
+
+
+def _start_worker(table, method, avoid_less_than, entropy, constraints):
+    """Compiles the table once for this process so every chunk it gets reuses it."""
+    compiled = get_table(table)
+    _worker.update(table=compiled, method=method, avoid_less_than=avoid_less_than, entropy=entropy,
+                   constraints=constraints, weights=compiled.weights(avoid_less_than) if method == "weighted" else None)
+
+
+def _optimize_chunk(chunk):
+    """Optimizes a list of (index, name, protein) records with the state from _start_worker()."""
+    import numpy as np
+    results = []
+    for index, name, protein in chunk:
+        if _worker["method"] == "hard":
+            results.append((name, hard_optimize(protein, _worker["table"])))
+        elif _worker["method"] == "constrained":
+            results.append((name, constrained_optimize(protein, _worker["table"], avoid_less_than=_worker["avoid_less_than"],
+                                                       **_worker["constraints"])))
+        else:  # Seeded by record index so the output doesn't depend on chunking or worker count
+            _premature_stops(protein)
+            rng = np.random.default_rng([index, _worker["entropy"]])
+            results.append((name, _sample_codons(protein, _worker["weights"], rng)))
+    return results
+
+
+def _chunks(records, chunk_size):
+    """Groups records into lists of (index, name, protein), naming bare strings by position."""
+    chunk = []
+    for index, record in enumerate(records):
+        name, protein = (f"sequence_{index+1}", record) if isinstance(record, str) else record
+        chunk.append((index, name, protein))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def optimize_many(records, table, method="weighted", avoid_less_than=.15, seed=None, workers=None,
+                  chunk_size=64, max_pending=None, constraints=None):
+    """Codon optimizes many proteins, yielding (name, nucleotide sequence) in input order.
+
+    'records' is a FASTA path or an iterable of (name, protein) pairs or bare protein strings. It is read lazily
+    and only 'max_pending' chunks (default twice the worker count) are in flight at once, so memory stays flat no
+    matter how many records there are. workers=1 runs in this process, None uses every core.
+    A given 'seed' gives the same output for every record whatever 'workers' and 'chunk_size' are.
+    method="constrained" runs constrained_optimize() with any keyword arguments given in 'constraints'.
+    """
+    import numpy as np
+    from concurrent.futures import ProcessPoolExecutor
+    if method not in ("weighted", "hard", "constrained"):
+        raise ValueError(f"Optimization method '{method}' unrecognized")
+    if isinstance(records, str):
+        records = read_fasta(records)
+    entropy = np.random.SeedSequence(seed).entropy
+    if isinstance(table, str):
+        get_table(table)  # Fail fast on a bad table name
+    constraints = constraints or {}
+    if workers == 1:
+        _start_worker(table, method, avoid_less_than, entropy, constraints)
+        for chunk in _chunks(records, chunk_size):
+            yield from _optimize_chunk(chunk)
+        return
+    workers = workers or cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    with ProcessPoolExecutor(workers, initializer=_start_worker,
+                             initargs=(table, method, avoid_less_than, entropy, constraints)) as pool:
+        pending = deque()
+        for chunk in _chunks(records, chunk_size):
+            if len(pending) == max_pending:  # Hand back the oldest chunk before reading any further
+                yield from pending.popleft().result()
+            pending.append(pool.submit(_optimize_chunk, chunk))
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main(argv=None):
+    """Command line entry point, run the script with --help for usage."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Codon optimize every protein in a FASTA file.")
+    parser.add_argument("proteins", help="protein FASTA file, optionally gzipped")
+    parser.add_argument("table", help=f"codon table name ({', '.join(available_tables(info='usage_name'))})")
+    parser.add_argument("-o", "--output", help="nucleotide FASTA to write, defaults to stdout")
+    parser.add_argument("-m", "--method", choices=["weighted", "hard", "constrained"], default="weighted")
+    parser.add_argument("-a", "--avoid-less-than", type=float, default=.15)
+    parser.add_argument("-s", "--seed", type=int)
+    parser.add_argument("-w", "--workers", type=int, help="worker processes, defaults to every core")
+    parser.add_argument("-c", "--chunk-size", type=int, default=64)
+    parser.add_argument("-f", "--forbidden", action="append",
+                        help="motif to keep out of constrained output, repeat for more (default BsaI and BsmBI)")
+    args = parser.parse_args(argv)
+    constraints = {"forbidden": args.forbidden} if args.forbidden else None
+    results = optimize_many(args.proteins, args.table, method=args.method, avoid_less_than=args.avoid_less_than,
+                            seed=args.seed, workers=args.workers, chunk_size=args.chunk_size, constraints=constraints)
+    if args.output:
+        with open(args.output, "w") as f:
+            write_fasta(results, f)
+    else:
+        write_fasta(results, sys.stdout)
 
 
 if __name__ == "__main__":
-    print(weighted_optimize("SAARLL",
-                            "drosophila",
-                            avoid_less_than=0.05))
+    main()
@@ -0,0 +1,157 @@
+'''
+Scores nucleotide sequences against a codon table, for ranking weighted_optimize() output or natural genes.
+
+score_batch(): CAI, GC3, rare codon fraction and the worst rare codon cluster of many sequences in one pass
+iter_scores(): Same for a FASTA file (or any iterable of (name, sequence)), streamed a batch at a time
+relative_adaptiveness(): Per-codon relative adaptiveness (w) profile of one sequence, for plotting
+
+Sequences are packed into arrays of codon numbers (three base-4 digits, see codon_optimizer.codon_number()) and every
+score is a NumPy gather from the compiled table's arrays plus a bincount per sequence, so there is no Python loop per
+codon. Tables are anything get_table() accepts. CAI follows Sharp & Li (1987): the geometric mean of w over every codon
+except stops, single codon amino acids (Met, Trp) and codons with anything but ACGT in them. Codons the table never
+uses (frequency 0, or not listed at all) get a small floor w ('min_w') rather than being left out, the frequency table
+equivalent of the usual 0.5 count pseudocount, so using them lowers CAI instead of being ignored.
+
+Requires NUMPY
+
+'''
+
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+
+if __package__:
+    from .codon_optimizer import get_table, read_fasta
+else:
+    from codon_optimizer import get_table, read_fasta
+
+_BASE_DIGITS = np.full(256, 4, dtype=np.uint8)  # ASCII -> base-4 digit, 4 for anything that isn't a base
+for _digit, _base in enumerate(b"ACGT"):
+    _BASE_DIGITS[_base] = _BASE_DIGITS[_base + 32] = _digit
+
+
+class CodonScore(NamedTuple):
+    name: str
+    codons: int  # Complete codons scored
+    cai: float  # NaN when no codon counts towards CAI
+    gc3: float  # Fraction of clean codons with G or C in the third position, NaN without clean codons
+    rare_fraction: float  # Fraction of clean codons used less often than 'rare_below', NaN without clean codons
+    worst_window: int  # Most rare codons in any 'window' codons in a row, -1 if the sequence is shorter
+    worst_window_start: int  # Codon index (from 0) that window starts at, -1 if the sequence is shorter
+
+
+def encode_codons(sequence) -> np.ndarray:
+    """Codon numbers (0-63, or 64 for a codon with anything but ACGT) of a nucleotide string or bytes, in frame 1.
+
+    A trailing partial codon is dropped.
+    """
+    if isinstance(sequence, str):
+        sequence = sequence.encode("ascii")
+    digits = _BASE_DIGITS[np.frombuffer(sequence, dtype=np.uint8)]
+    digits = digits[:len(digits) - len(digits) % 3].reshape(-1, 3)
+    numbers = (digits[:, 0] << 4 | digits[:, 1] << 2 | digits[:, 2]).astype(np.uint8)
+    numbers[(digits == 4).any(axis=1)] = 64
+    return numbers
+
+
+@lru_cache(maxsize=32)
+def _floored_arrays(compiled, min_w):
+    """(frequency, w, amino acid) over 65 codon numbers, with codons missing from the table filled in from the
+    standard genetic code at frequency 0, and w no lower than 'min_w' for every clean codon."""
+    if __package__:
+        from .codon_table_builder import _STANDARD_CODE, _amino_acids
+    else:
+        from codon_table_builder import _STANDARD_CODE, _amino_acids
+    frequency, adaptiveness, amino_acid = compiled.codon_arrays()
+    missing = np.isnan(frequency[:64])
+    frequency, adaptiveness, amino_acid = frequency.copy(), adaptiveness.copy(), amino_acid.copy()
+    frequency[:64][missing] = 0.0
+    amino_acid[:64][missing] = _amino_acids(_STANDARD_CODE)[:64][missing]
+    adaptiveness[:64] = np.maximum(np.nan_to_num(adaptiveness[:64], nan=0.0), min_w)
+    for array in (frequency, adaptiveness, amino_acid):
+        array.flags.writeable = False
+    return frequency, adaptiveness, amino_acid
+
+
+def relative_adaptiveness(sequence, table, min_w=.01) -> np.ndarray:
+    """w of every codon in 'sequence' for 'table' (at least 'min_w'), NaN where the codon isn't clean."""
+    return _floored_arrays(get_table(table), min_w)[1][encode_codons(sequence)]
+
+
+def _scoring_arrays(compiled, rare_below, min_w):
+    """(log w with 0 where CAI skips the codon, counts towards CAI, GC3, rare) lookups over 65 codon numbers."""
+    frequency, adaptiveness, amino_acid = _floored_arrays(compiled, min_w)
+    family_size = np.bincount(amino_acid, minlength=256)[amino_acid]
+    in_cai = (amino_acid != ord("*")) & (family_size > 1) & (amino_acid != 0)
+    log_w = np.where(in_cai, np.log(np.where(in_cai, adaptiveness, 1.0)), 0.0)
+    gc3 = np.zeros(65, dtype=bool)
+    gc3[[n for n in range(64) if n & 3 in (1, 2)]] = True  # Third digit C or G
+    rare = np.nan_to_num(frequency, nan=np.inf) < rare_below  # Only index 64 (unclean) is still NaN
+    return log_w, in_cai, gc3, rare
+
+
+def score_batch(sequences, table, rare_below=.1, window=20, names=None, min_w=.01) -> list:
+    """Scores every nucleotide sequence in 'sequences' against 'table' in one pass, returning CodonScores in order.
+
+    Codons with a table frequency below 'rare_below' count as rare, and the rare cluster score is the most rare codons
+    found in any 'window' consecutive codons of a sequence (-1, starting at -1, for a sequence shorter than 'window').
+    Codons the table never uses count as rare, and towards CAI with w = 'min_w'. A sequence with no clean codons
+    (e.g. "NNNNNN") gets NaN for cai, gc3 and rare_fraction, as does cai for one with only Met, Trp and stops. NaN
+    doesn't sort, so drop or key on math.isnan() before ranking.
+    """
+    if window <= 0:
+        raise ValueError(f"window must be at least 1 codon, not {window}")
+    log_w, in_cai, gc3, rare = _scoring_arrays(get_table(table), rare_below, min_w)
+    encoded = [encode_codons(sequence) for sequence in sequences]
+    n = len(encoded)
+    if not n:
+        return []
+    lengths = np.array([len(codons) for codons in encoded])
+    codons = np.concatenate(encoded)
+    owner = np.repeat(np.arange(n), lengths)
+    clean = (codons != 64).astype(float)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cai = np.exp(np.bincount(owner, log_w[codons], n) / np.bincount(owner, in_cai[codons], n))
+        gc3_fraction = np.bincount(owner, gc3[codons], n) / np.bincount(owner, clean, n)
+        rare_fraction = np.bincount(owner, rare[codons], n) / np.bincount(owner, clean, n)
+
+    # Rare codons in every window, from a running total over the whole batch. Windows crossing into the next
+    # sequence are masked out before taking each sequence's worst one.
+    starts = np.r_[0, np.cumsum(lengths)[:-1]]
+    running = np.r_[0, np.cumsum(rare[codons], dtype=np.int64)]
+    windows = running[window:] - running[:-window] if len(codons) >= window else np.zeros(0, dtype=np.int64)
+    window_owner = owner[:len(windows)]
+    valid = np.arange(len(windows)) + window <= (starts + lengths)[window_owner]
+    scores = np.where(valid, windows, -1)
+    worst = np.full(n, -1)
+    worst_start = np.full(n, -1)
+    if len(scores):
+        np.maximum.at(worst, window_owner, scores)
+        # Sorting by sequence, then score (high first), then position puts each sequence's first worst window first
+        order = np.lexsort((np.arange(len(scores)), -scores, window_owner))
+        first = order[np.r_[True, window_owner[order][1:] != window_owner[order][:-1]]]
+        has_window = worst[window_owner[first]] >= 0
+        worst_start[window_owner[first][has_window]] = (first - starts[window_owner[first]])[has_window]
+
+    names = range(n) if names is None else names
+    return [CodonScore(name, int(length), float(c), float(g), float(r), int(w), int(s)) for name, length, c, g, r, w, s
+            in zip(names, lengths, cai, gc3_fraction, rare_fraction, worst, worst_start)]
+
+
+def iter_scores(source, table, rare_below=.1, window=20, batch_size=1024, min_w=.01):
+    """Streams CodonScores for a FASTA path (optionally .gz), open handle or iterable of (name, sequence) pairs,
+    scoring 'batch_size' records at a time so memory stays flat however big the input is."""
+    records = read_fasta(source) if isinstance(source, str) or hasattr(source, "read") else iter(source)
+    get_table(table)  # Compile once up front rather than on the first batch
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield from score_batch([s for _, s in batch], table, rare_below, window, [name for name, _ in batch],
+                               min_w)
+            batch = []
+    if batch:
+        yield from score_batch([s for _, s in batch], table, rare_below, window, [name for name, _ in batch],
+                               min_w)
@@ -0,0 +1,240 @@
+'''
+Builds codon tables for codon_optimizer.py from coding sequences, instead of copying them by hand from a website.
+
+count_codons(): Streams a CDS FASTA file (optionally gzipped) and counts all 64 codons, in parallel shards for plain files
+build_table(): Turns the counts into per amino acid frequencies, {aa: {codon: frequency}}
+write_table(): Saves a table in the {"meta", "table"} format of codontables/, where available_tables() and every
+               optimizer pick it up by name straight away
+
+From the command line, e.g. a table from only the ribosomal protein genes of a genome:
+    python codon_table_builder.py GCF_000005845.2_cds_from_genomic.fna.gz ecoli_ribosomal \
+        --name "Escherichia coli K-12 (ribosomal proteins)" --match "ribosomal protein"
+
+Files are read a block at a time and each piece of sequence has its codons packed into numbers (see
+codon_scoring.encode_codons()) and counted with a bincount, carrying only the 0-2 bases past the last whole codon to the
+next piece, so neither memory nor time per base grows with the input or with record length. Only complete CDS are
+counted by default: a whole number of codons, only ACGT and no stop before the last codon.
+
+Requires NUMPY
+
+'''
+
+import json
+import mmap
+import os
+import re
+from datetime import date
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+
+if __package__:
+    from .codon_optimizer import _table_dir
+    from .codon_scoring import encode_codons
+else:
+    from codon_optimizer import _table_dir
+    from codon_scoring import encode_codons
+
+# Standard genetic code, with codons in TCAG order the way it is usually printed
+_STANDARD_CODE = dict(zip(("".join(codon) for codon in product("TCAG", repeat=3)),
+                          "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"))
+_BLOCK_SIZE = 1 << 22
+
+
+def _amino_acids(genetic_code):
+    """ASCII amino acid of every codon number (0 for 64, the unclean codon) for a {codon: aa} genetic code."""
+    amino_acids = np.zeros(65, dtype=np.uint8)
+    for codon, aa in genetic_code.items():
+        amino_acids[encode_codons(codon)[0]] = ord(aa)
+    return amino_acids
+
+
+class _Counter:
+    """Counts codons of FASTA records fed to it a piece at a time, keeping only the 0-2 bases left over from the last
+    piece of sequence, so long records (even ones on a single line) cost linear time."""
+
+    def __init__(self, amino_acids, match=None, complete_only=True):
+        self.amino_acids, self.complete_only = amino_acids, complete_only
+        self.pattern = re.compile(match) if match else None
+        self.counts = np.zeros(65, dtype=np.int64)
+        self.used = self.skipped = 0
+        self.active = False  # In a record that matches and is being counted
+
+    def start(self, header):
+        self.finish()
+        header = header.strip().decode(errors="replace")
+        self.active = self.pattern is None or bool(self.pattern.search(header))
+        self.record = np.zeros(65, dtype=np.int64)
+        self.carry, self.stops, self.last_stop = b"", 0, False
+
+    def feed(self, data):
+        if not self.active:
+            return
+        sequence = self.carry + data.translate(None, b"\r\n\t ")
+        whole = len(sequence) - len(sequence) % 3
+        self.carry = sequence[whole:]
+        if whole:
+            codons = encode_codons(sequence[:whole])
+            self.record += np.bincount(codons, minlength=65)
+            stops = self.amino_acids[codons] == ord("*")
+            self.stops += int(np.count_nonzero(stops))
+            self.last_stop = bool(stops[-1])
+
+    def finish(self):
+        if not self.active:
+            return
+        self.active = False
+        internal_stops = self.stops - self.last_stop  # A stop as the last codon is fine
+        if self.complete_only and (self.carry or not self.record.any() or self.record[64] or internal_stops):
+            self.skipped += 1
+            return
+        self.used += 1
+        self.counts += self.record
+
+
+def _count(blocks, amino_acids, match=None, complete_only=True):
+    """Counts codons in an iterable of FASTA byte blocks. Returns (counts of the 64 codons, records used, records
+    skipped).
+
+    'match' is checked against each header, with 'complete_only' records that aren't a whole number of clean codons
+    without an internal stop are skipped. Anything before the first header is ignored.
+    """
+    counter = _Counter(amino_acids, match, complete_only)
+    header, line_start = None, True  # header: bytes of a header read so far, None when in sequence
+    for block in blocks:
+        position = 0
+        while position < len(block):
+            if header is not None:
+                newline = block.find(b"\n", position)
+                if newline < 0:
+                    header += block[position:]
+                    break
+                counter.start(header + block[position:newline])
+                header, position, line_start = None, newline + 1, True
+            elif line_start and block[position] == ord(">"):
+                header, position = b"", position + 1
+            else:
+                next_header = block.find(b"\n>", position)
+                end = next_header + 1 if next_header >= 0 else len(block)
+                counter.feed(block[position:end])
+                position, line_start = end, block[end - 1] == ord("\n")
+    if header is not None:
+        counter.start(header)
+    counter.finish()
+    return counter.counts[:64], counter.used, counter.skipped
+
+
+def _shards(path, workers):
+    """Splits a FASTA file into about 'workers' (start, end) byte ranges that each begin at a '>'."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        bounds = [0]
+        for i in range(1, workers):
+            start = data.find(b"\n>", max(bounds[-1], size * i // workers))
+            if start < 0:
+                break
+            bounds.append(start + 1)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _count_shard(path, start, end, amino_acids, match, complete_only):
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        blocks = (data[i:min(i + _BLOCK_SIZE, end)] for i in range(start, end, _BLOCK_SIZE))
+        return _count(blocks, amino_acids, match, complete_only)
+
+
+def count_codons(source, match=None, complete_only=True, workers=1, genetic_code=None):
+    """Counts every codon in a CDS FASTA file, returning ({codon: count}, records used, records skipped).
+
+    'match' is a regular expression a record's header has to contain to be counted, e.g. to only count highly
+    expressed genes. With 'complete_only', partial CDS, ones with ambiguous bases and ones with an internal stop are
+    skipped. Plain files are split into 'workers' shards counted in parallel (None for every core), gzipped ones
+    are streamed in this process.
+    """
+    amino_acids = _amino_acids(genetic_code or _STANDARD_CODE)
+    source = str(source)
+    with open(source, "rb") as f:
+        gzipped = f.read(2) == b"\x1f\x8b"
+    workers = workers or os.cpu_count() or 1
+    if gzipped or workers == 1:
+        if gzipped:
+            import gzip
+            opener = gzip.open
+        else:
+            opener = open
+        with opener(source, "rb") as f:
+            counts, used, skipped = _count(iter(lambda: f.read(_BLOCK_SIZE), b""), amino_acids, match, complete_only)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        shards = _shards(source, workers)
+        with ProcessPoolExecutor(min(workers, len(shards) or 1)) as pool:
+            futures = [pool.submit(_count_shard, source, start, end, amino_acids, match, complete_only)
+                       for start, end in shards]
+            results = [future.result() for future in futures]
+        counts = sum((result[0] for result in results), np.zeros(64, dtype=np.int64))
+        used, skipped = sum(result[1] for result in results), sum(result[2] for result in results)
+    codons = ["".join(codon) for codon in product("ACGT", repeat=3)]  # Codon number order
+    return dict(zip(codons, counts.tolist())), used, skipped
+
+
+def build_table(counts, genetic_code=None, digits=4) -> dict:
+    """Frequency of each codon among the codons for its amino acid, as {aa: {codon: frequency}}.
+
+    Frequencies are rounded down to 'digits' decimals so no amino acid adds up to more than 1 (weighted_optimize()
+    refuses those). Amino acids that were never seen get equal frequencies.
+    """
+    genetic_code = genetic_code or _STANDARD_CODE
+    table = {}
+    for codon, aa in genetic_code.items():
+        table.setdefault(aa, {})[codon] = counts.get(codon, 0)
+    scale = 10 ** digits
+    for aa, codons in table.items():
+        total = sum(codons.values())
+        for codon, count in codons.items():
+            codons[codon] = int((count / total if total else 1 / len(codons)) * scale) / scale
+        while sum(codons.values()) > 1:  # Float rounding can still tip the sum over
+            top = max(codons, key=codons.get)
+            codons[top] = round(codons[top] - 1 / scale, digits)
+    return table
+
+
+def write_table(table, usage_name, name, table_type="nuclear", source="", folder=None, **meta):
+    """Saves a table as 'usage_name'.json in codontables/ (or 'folder'), ready for get_table('usage_name').
+
+    Any extra keyword arguments are added to the meta block. Returns the path written.
+    """
+    path = Path(folder if folder is not None else _table_dir()) / f"{usage_name}.json"
+    contents = {"meta": {"name": name, "type": table_type, "source": source, "date": date.today().isoformat(), **meta},
+                "table": table}
+    path.write_text(json.dumps(contents, indent=2) + "\n")
+    return path
+
+
+def main(argv=None):
+    """Command line entry point, run the script with --help for usage."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Build a codon table from a CDS FASTA file.")
+    parser.add_argument("cds", help="CDS FASTA file, optionally gzipped")
+    parser.add_argument("usage_name", help="name to use the table by, e.g. ecoli_k12")
+    parser.add_argument("--name", help="organism name for the table's meta block, defaults to usage_name")
+    parser.add_argument("--type", default="nuclear", help="meta type, e.g. nuclear or mitochondrial")
+    parser.add_argument("--match", help="only count records whose header matches this regular expression")
+    parser.add_argument("--all", action="store_true", help="count incomplete CDS as well")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="processes for plain files, 0 for every core")
+    parser.add_argument("-o", "--folder", help="folder to write to, defaults to codontables/")
+    args = parser.parse_args(argv)
+    counts, used, skipped = count_codons(args.cds, args.match, not args.all, args.workers or None)
+    if not used:
+        parser.error("no usable CDS found")
+    path = write_table(build_table(counts), args.usage_name, args.name or args.usage_name, args.type,
+                       source=os.path.basename(args.cds), folder=args.folder, cds=used, codons=sum(counts.values()),
+                       **({"match": args.match} if args.match else {}))
+    print(f"Counted {sum(counts.values())} codons from {used} CDS ({skipped} skipped), wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
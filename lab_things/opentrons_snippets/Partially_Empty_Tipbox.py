@@ -10,17 +10,19 @@ I am not responsible for any damage done to your labware.
 """
 
 from opentrons import simulate  # Replace with execute if you want to run this on the robot
+from tip_tracker import TipTracker  # tip_tracker.py lives next to this file
 
-def drop_tips(tipbox, number_of_tips):
+def drop_tips(tipbox, number_of_tips, tracker=None):
     """Removes the first n number of tips from the rack, so that it starts on the next one"""
-    for well in tipbox.wells()[:number_of_tips]:
-        well.has_tip = False
+    tracker = tracker or TipTracker([tipbox])
+    tracker.mark_used(tipbox, number_of_tips)
+    return tracker
 
-def starting_tip(tipbox, coordinates: str):
+def starting_tip(tipbox, coordinates: str, tracker=None):
     """Drops all tips before the starting tip, so that the robot starts at the given tip coordinate"""
-    wells = list(tips.wells_by_name().keys())
-    coord_value = wells.index(coordinates)
-    drop_tips(tipbox, coord_value)
+    tracker = tracker or TipTracker([tipbox])
+    tracker.mark_used_before(tipbox, coordinates)
+    return tracker
 
 # Example of how to use the above functions
 
@@ -9,13 +9,17 @@ of an implementation of this: instructing the robot to throw out 100 pipette tip
 To deploy it yourself, you may need to make ajustments to the pipette class for your particular use case and
 obviously you will need to tell the robot what is on the deck/integrate the rest of your protocol.
 
+What happens when the tips run out is up to the pipette's refill strategy (see tip_refill.py): by default it asks the
+operator and waits, but it can also switch to spare racks or ask for a refill in the background, see run_unattended().
+
 I am not responsible for any damage that may occur to your equipment.
 
 """
 
 # Imports
-from opentrons.protocol_api.labware import OutOfTipsError, filter_tipracks_to_start, split_tipracks, Well, Labware
+from opentrons.protocol_api.labware import OutOfTipsError, TipSelectionError, Well, Labware
 from opentrons.protocol_api.instrument_context import InstrumentContext
+from opentrons import types
 from opentrons.types import Location
 from typing import List, Optional, Union, Tuple, TYPE_CHECKING
 from opentrons.protocols.api_support.instrument import validate_tiprack
@@ -23,6 +27,9 @@ from opentrons.commands.publisher import CommandPublisher, publish, publish_cont
 from opentrons.commands import commands as cmds
 import logging
 
+from tip_tracker import TipTracker  # tip_tracker.py and tip_refill.py live next to this file
+from tip_refill import RefillChain, SpareRacks, QueuedRefill, PromptRefill
+
 # Change to execute if you are actually running this on a machine
 from opentrons import simulate
 
@@ -36,9 +43,12 @@ logger = logging.getLogger(__name__)
 
 # Overwrite the pipette with a custom class by coppying the contents of the class instance to a new instrumentcontext
 class CustomPipette(InstrumentContext):
-    def __init__(self, parent_instance):
+    def __init__(self, parent_instance, refill_strategy=None):
         vars(self).update(vars(parent_instance))
-        self.out_of_tips_func = self.prompt_refill_tips # Defines what happens when tips run out. In theory you can overwrite this
+        self.tip_tracker = TipTracker(self.tip_racks)  # Bitmask copy of the racks, so finding a tip doesn't rescan them
+        # What to do when tips run out, see tip_refill.py. Defaults to asking the operator, like before
+        self.refill_strategy = refill_strategy or RefillChain(PromptRefill())
+        self.out_of_tips_func = self.refill_tips # Defines what happens when tips run out. In theory you can overwrite this
         
     def pick_up_tip(
         self,
@@ -56,9 +66,16 @@ class CustomPipette(InstrumentContext):
         if location and isinstance(location, types.Location):
             if location.labware.is_labware:
                 tiprack = location.labware.as_labware()
-                target: Well = tiprack.next_tip(self.channels)  # type: ignore
+                if tiprack in self.tip_tracker:
+                    found = self.tip_tracker.next_tip(self.channels, racks=[tiprack])  # Only the rack asked for
+                    target: Well = found[1] if found else None  # type: ignore
+                else:
+                    target = tiprack.next_tip(self.channels)  # type: ignore
                 if not target:
-                    return self.out_of_tips_func()  # We're hijacking at this point. Everything else is factory.
+                    found = self.out_of_tips_func()  # We're hijacking at this point. Everything else is factory.
+                    if not found:
+                        raise OutOfTipsError
+                    tiprack, target = found
             elif location.labware.is_well:
                 target = location.labware.as_well()
                 tiprack = target.parent
@@ -93,8 +110,12 @@ class CustomPipette(InstrumentContext):
             )
             # Note that the hardware API pick_up_tip action includes homing z after
 
-        tiprack.use_tips(target, self.channels)
+        if tiprack in self.tip_tracker:
+            self.tip_tracker.use(target, self.channels)  # Also clears has_tip on the wells, like use_tips
+        else:
+            tiprack.use_tips(target, self.channels)
         self._last_tip_picked_up_from = target
+        self.refill_strategy.on_pickup(self)
 
         return self
     
@@ -103,66 +124,57 @@ class CustomPipette(InstrumentContext):
     def next_available_tip(self,
     starting_tip: Optional[Well], tip_racks: List[Labware], channels: int
     ) -> Tuple[Labware, Well]:
-        start = starting_tip
-        if start is None:
-            return self.select_tiprack_from_list(tip_racks, channels)
-        else:
-            return self.select_tiprack_from_list(
-                filter_tipracks_to_start(start, tip_racks), channels, start
-            )
+        return self.select_tiprack_from_list(tip_racks, channels, starting_tip)
 
     # This one is called by the one above and is the second place the robot can throw the error, so we change it
     def select_tiprack_from_list(self,
         tip_racks: List[Labware], num_channels: int, starting_point: Optional[Well] = None
         ) -> Tuple[Labware, Well]:
-
-        first, rest = None, None
-        try:
-            first, rest = split_tipracks(tip_racks)
-        except IndexError:
-            output = self.out_of_tips_func() # The other place we hijack is here
-            if output:
-                return output
-            else: # There's some weird behavior replacing tips from this spot. This else helps with that.
-                try:
-                    first, rest = split_tipracks(self.tip_racks)
-                except IndexError:
-                    raise OutOfTipsError
-
-        if starting_point and starting_point.parent != first:
+        """Finds the next tip in 'tip_racks' from the tracker in one pass over the racks' column masks, rather than
+        recursing rack by rack"""
+        if starting_point and starting_point.parent not in tip_racks:
             raise TipSelectionError(
-                "The starting tip you selected " f"does not exist in {first}"
+                "The starting tip you selected " f"does not exist in {tip_racks}"
             )
-        elif starting_point:
-            first_well = starting_point
-        else:
-            first_well = first.wells()[0]
+        for rack in tip_racks:
+            self.tip_tracker.add(rack)  # No-op for racks it already tracks
+
+        found = self.tip_tracker.next_tip(num_channels, starting_point, tip_racks)
+        if found:
+            return found
+
+        output = self.out_of_tips_func() # The other place we hijack is here
+        if output:
+            return output
+        # Strategies that refill racks do it through the tracker, so it already knows about it
+        found = self.tip_tracker.next_tip(num_channels, racks=tip_racks)
+        if not found:
+            raise OutOfTipsError
+        return found
 
-        next_tip = first.next_tip(num_channels, first_well)
-        if next_tip:
-            return first, next_tip
-        else:
-            return self.select_tiprack_from_list(rest, num_channels)
-    
     def out_of_tips_error(self):
         "This is the default function called when the pipette runs out of tips" # Set this as the function to restore default behavior
         raise OutOfTipsError
         
+    def refill_tips(self):
+        "This is the default function called when the pipette runs out of tips, it hands over to the refill strategy"
+        return self.refill_strategy(self)
+
     def prompt_refill_tips(self):
         "This function prompts the operator to refill tips"
-        print('Please replace the following tip boxes:')
-        for box in self.tip_racks:
-            print(box)  # This script assumes you're using jupyter notebook. If you're not, you'll need to change this to pause the script
-        input('Press Enter When Finished')
-        for box in self.tip_racks:
-            replace_tipbox(box)
-        print('Done refilling tip boxes')
+        return PromptRefill()(self)  # This script assumes you're using jupyter notebook. If you're not, pass protocol.pause to PromptRefill
 
+    @property
+    def tip_wait_time(self) -> float:
+        "Seconds spent so far getting more tips, if the refill strategy keeps count (RefillChain does)"
+        return getattr(self.refill_strategy, "wait_time", lambda: 0.0)()
 
-def replace_tipbox(tipbox, missing_tips = 0):
+
+def replace_tipbox(tipbox, missing_tips = 0, tracker=None):
     '''Takes given tipbox and refills its tips, changing nothing else'''
-    for well in tips.wells()[missing_tips:]:
-        well.has_tip = True
+    tracker = tracker or TipTracker([tipbox])
+    tracker.refill(tipbox, missing_tips)
+    return tracker
         
 
 
@@ -179,6 +191,23 @@ def run(protocol):
     for _ in range(100):
         custom_pipette.pick_up_tip()
         custom_pipette.drop_tip()
+    print(f"Time spent waiting on tips: {custom_pipette.tip_wait_time:.1f} s")
+
+
+def run_unattended(protocol):
+    # Same as run(), but moves on to a spare rack in slot 2 and asks for the empty one to be refilled while it
+    # keeps going, only pausing if both racks run dry before anyone gets to it
+    tips = protocol.load_labware("thermoscientificarttips_96_tiprack_200ul", 1)
+    spare = protocol.load_labware("thermoscientificarttips_96_tiprack_200ul", 2)
+    pipette = protocol.load_instrument("p300_single", "right", tip_racks=[tips])
+
+    refill = QueuedRefill(notify=lambda racks: protocol.comment(f"Please refill {', '.join(map(str, racks))}"))
+    custom_pipette = CustomPipette(pipette, RefillChain(SpareRacks([spare]), refill, PromptRefill(protocol.pause)))
+
+    for _ in range(250):
+        custom_pipette.pick_up_tip()
+        custom_pipette.drop_tip()
+    print(custom_pipette.refill_strategy.summary())
 
 if __name__ == "__main__":
     run(protocol)
@@ -0,0 +1,105 @@
+"""
+Volume to height lookups for tracked containers (see falcon_liquid_tracking.py), loaded from data files.
+
+Each file in geometries/ is a calibrated curve of liquid height (mm above the bottom) against volume (ul), plus
+how far below the surface the tip should go and the lowest it should go. get_profile() compiles a file once into
+sorted arrays of volume and aspirate height, shared by every container of that type. A lookup is then a binary
+search and a linear interpolation, which stays monotone as long as the data is. To add labware, drop a new file
+in geometries/ (same format as falcon_15ml.json) or call register_profile().
+
+I am not responsible for any damage done to your labware.
+"""
+
+import json
+from bisect import bisect_right
+from pathlib import Path
+
+import numpy as np
+
+
+def _geometry_dir():
+    return Path(__file__).parent / 'geometries'
+
+
+def available_profiles() -> list:
+    "Names of the bundled geometry profiles, for get_profile()"
+    return sorted(path.stem for path in _geometry_dir().glob('*.json'))
+
+
+class GeometryProfile:
+    __slots__ = ("name", "minimum_volume", "maximum_volume", "volumes", "heights", "_volume_list", "_height_list")
+
+    def __init__(self, name, volumes, heights, minimum_volume=None, maximum_volume=None, immersion=0, floor=0):
+        """Compiles a measured height curve into an aspirate height table.
+
+        'volumes' must be increasing and 'heights' must not decrease. The aspirate height is 'immersion' mm below
+        the liquid surface, but never less than 'floor' mm above the bottom.
+        """
+        volumes = np.asarray(volumes, dtype=float)
+        heights = np.asarray(heights, dtype=float)
+        if volumes.ndim != 1 or volumes.shape != heights.shape or len(volumes) < 2:
+            raise ValueError(f"{name}: needs matching lists of at least two volumes and heights")
+        if np.any(np.diff(volumes) <= 0) or np.any(np.diff(heights) < 0):
+            raise ValueError(f"{name}: volumes must increase and heights must not decrease")
+        self.name = name
+        self.minimum_volume = volumes[0] if minimum_volume is None else minimum_volume
+        self.maximum_volume = volumes[-1] if maximum_volume is None else maximum_volume
+        self.volumes = volumes
+        self.heights = np.maximum(heights - immersion, floor)
+        self.volumes.flags.writeable = self.heights.flags.writeable = False  # Shared between containers
+        self._volume_list = volumes.tolist()  # Plain floats are quicker than numpy scalars one lookup at a time
+        self._height_list = self.heights.tolist()
+
+    def level(self, volume) -> float:
+        "Aspirate height for one volume, clamped to the ends of the table"
+        i = bisect_right(self._volume_list, volume)
+        if i == 0:
+            return self._height_list[0]
+        if i == len(self._volume_list):
+            return self._height_list[-1]
+        v0, v1 = self._volume_list[i - 1], self._volume_list[i]
+        h0, h1 = self._height_list[i - 1], self._height_list[i]
+        return h0 + (h1 - h0) * (volume - v0) / (v1 - v0)
+
+    def levels(self, volumes) -> np.ndarray:
+        "Aspirate heights for an array of volumes at once"
+        return np.interp(volumes, self.volumes, self.heights)
+
+    def __repr__(self):
+        return f"GeometryProfile({self.name!r}, {self.minimum_volume:g}-{self.maximum_volume:g} ul)"
+
+
+_profiles = {}
+
+
+def load_profile(path) -> GeometryProfile:
+    """Compiles a geometry file without registering it. The file holds {"meta": {...}, "profile": [[ul, mm], ...]},
+    with meta keys name, minimum_volume, maximum_volume, immersion and floor (all optional)."""
+    path = Path(path)
+    with open(path) as f:
+        data = json.load(f)
+    meta = data.get("meta", {})
+    volumes, heights = zip(*data["profile"])
+    return GeometryProfile(meta.get("name", path.stem), volumes, heights,
+                           minimum_volume=meta.get("minimum_volume"), maximum_volume=meta.get("maximum_volume"),
+                           immersion=meta.get("immersion", 0), floor=meta.get("floor", 0))
+
+
+def register_profile(name, profile):
+    "Makes a GeometryProfile available to get_profile() under 'name'"
+    _profiles[name] = profile
+    return profile
+
+
+def get_profile(name) -> GeometryProfile:
+    "Shared, compiled profile by name (a bundled file, or one from register_profile()), or a path to a data file"
+    if isinstance(name, GeometryProfile):
+        return name
+    if name not in _profiles:
+        path = _geometry_dir() / f"{name}.json"
+        if not path.exists() and Path(name).exists():
+            path = Path(name)
+        elif not path.exists():
+            raise KeyError(f"No geometry profile '{name}', options are {available_profiles()}")
+        _profiles[name] = load_profile(path)
+    return _profiles[name]
@@ -1,30 +1,40 @@
 # Liquid tracked container classes
 
+import warnings
+
 from opentrons.protocol_api.labware import Well, Labware, Location
 
+from container_geometry import get_profile  # container_geometry.py lives next to this file
+
 class tracked_container():
-    minimum_volume = None #ul
-    maximum_volume = None #ul
-    bottom_out = None  # The remaining volume where the arm just goes to the bottom
-    offset_hight = None # Pretend there is 2mL less to allow for room to withdraw liquid
-    offset_rate = None # Height in mm for each milliliter
-    offset_constant = None
-    
-    
-    def __init__(self):
-        if self.minimum_volume == None:
-            raise NotImplementedError('Subclasses must define self.minimum_volume')
-        if self.maximum_volume == None:
-            raise NotImplementedError('Subclasses must define self.maximum_volume')
-        if self.offset_hight == None:
-            raise NotImplementedError('Subclasses must define self.offset_hight')
-        if self.offset_rate == None:
-            raise NotImplementedError('Subclasses must define self.offset_rate')
-        if self.offset_constant == None:
-            raise NotImplementedError('Subclasses must define self.offset_constant')
-        if self.bottom_out == None:
-            raise NotImplementedError('Subclasses must define self.bottom_out')
-    
+    # Volume/height curves live in geometries/ and are shared between containers of a type, see container_geometry.py
+    __slots__ = ("current_volume", "location", "label", "namespace", "version", "geometry")
+    profile = None  # Name of the geometry profile, set by subclasses
+
+    def __init__(self, protocol, initial_volume,
+        location,
+        label = None,
+        namespace = None,
+        version = None,
+        profile = None):
+
+        self.current_volume = initial_volume
+        self.location = location
+        self.label = label
+        self.namespace = namespace
+        self.version = version
+        if profile is None and self.profile is None:
+            raise NotImplementedError('Subclasses must define profile, or pass one in')
+        self.geometry = get_profile(profile or self.profile)
+
+    @property
+    def minimum_volume(self):
+        return self.geometry.minimum_volume
+
+    @property
+    def maximum_volume(self):
+        return self.geometry.maximum_volume
+
     def subtract_volume(self, volume_extracted=0):
         "Subtracts volume from current and returns new volume"
         volume_remaining = self.current_volume - volume_extracted
@@ -47,71 +57,35 @@ class tracked_container():
 
     def get_fluid_level(self):
         "Returns Z-offest of top of fluid in mm"
-        if self.current_volume > self.maximum_volume:
-            UserWarning("Falcon tube above capasity")
+        return self.level_at(self.current_volume)
+
+    def level_at(self, volume):
+        "Z-offset the fluid would be at holding 'volume', without changing the tracked volume"
+        if volume > self.maximum_volume:
+            warnings.warn(f"{self.label or 'Container'} above capasity")
             return
-        elif self.bottom_out <= self.current_volume:
-            _delta_volume = self.current_volume - self.offset_hight
-            _offset = self.offset_constant + self.offset_rate*_delta_volume/1_000
-            return _offset
-        elif self.minimum_volume <= self.current_volume:
-            return 3
+        elif self.minimum_volume <= volume:
+            return self.geometry.level(volume)
         elif self.label:
             raise ValueError(f"{self.label} is empty")
         else:
             raise ValueError(f"Container at {self.location} is empty!")
-            
-            
+
+    def levels_at(self, volumes):
+        "level_at() for an array of volumes, without the empty/overfull checks"
+        return self.geometry.levels(volumes)
+
+
 class falcon_tube_15(tracked_container):
+    __slots__ = ()
+    profile = "falcon_15ml"
 
-    def __init__(self, protocol, initial_volume,
-        location,
-        label = None,
-        namespace = None,
-        version = None):
 
-        self.current_volume = initial_volume
-        self.location = location
-        self.label = label
-        self.namespace = namespace
-        self.version = version
-        
-        
-        self.minimum_volume = 200 #ul
-        self.maximum_volume = 15_000 #ul
-        self.bottom_out = 1_500  # The remaining volume where the arm just goes to the bottom
-        self.offset_hight = 2_000 # Pretend there is 2mL less to allow for room to withdraw liquid
-        self.offset_rate = 6.1 # Height in mm for each milliliter
-        self.offset_constant = 21
-        
-        super().__init__()
-        
-        
 class falcon_tube_50(tracked_container):
+    __slots__ = ()
+    profile = "falcon_50ml"
 
-    def __init__(self, protocol, initial_volume,
-        location,
-        label = None,
-        namespace = None,
-        version = None):
 
-        self.current_volume = initial_volume
-        self.location = location
-        self.label = label
-        self.namespace = namespace
-        self.version = version
-        
-        
-        self.minimum_volume = 1_000 #ul
-        self.maximum_volume = 50_000 #ul
-        self.bottom_out = 5_000  # The remaining volume where the arm just goes to the bottom
-        self.offset_hight = 2_000 # Pretend there is 2mL less to allow for room to withdraw liquid
-        self.offset_rate = 6.1/5 # Height in mm for each milliliter
-        self.offset_constant = 0
-        
-        super().__init__()
-        
-        
 # Tracked Transfer Function
 
 def tracked_transfer(source, destination, pipette, volume):
@@ -173,6 +147,139 @@ def tracked_transfer(source, destination, pipette, volume):
     pipette.well_bottom_clearance.dispense = original_dis_clearance
     
     
+# Transfer Planner
+# tracked_transfer() does one aspirate/dispense round trip per max_volume chunk of every job. For filling a plate
+# from one reservoir that is a lot of arm travel, so plan_transfers() takes the whole list of jobs and packs
+# consecutive jobs from the same source into multi-dispense passes, working out every aspirate/dispense height
+# from the tracked container models up front (and failing before anything moves if a source would run dry).
+
+from collections import namedtuple
+
+Dispense = namedtuple("Dispense", ["destination", "volume", "height"])  # height is None for untracked wells
+Pass = namedtuple("Pass", ["source", "volume", "height", "dispenses"])  # volume includes the disposal volume
+
+
+def _is_tracked(container):
+    return type(container) not in [Well, Location]
+
+
+def _location(container):
+    return container.location if _is_tracked(container) else container
+
+
+def _level_at(container, volume, default=None):
+    "Fluid level of a tracked container if it held 'volume', without changing it"
+    try:
+        return container.level_at(volume)
+    except ValueError:
+        if default is None:
+            raise
+        return default
+
+
+def _at_height(location, height):
+    "Where to aspirate/dispense, 'height' mm above the bottom of a well, or the pipette's default clearance"
+    if height is None:
+        return location
+    return location.bottom(height) if isinstance(location, Well) else location.labware.as_well().bottom(height)
+
+
+class TransferPlan:
+    def __init__(self, passes, baseline_motions):
+        self.passes = passes
+        self.baseline_motions = baseline_motions  # What the same jobs cost through tracked_transfer()
+
+    @property
+    def motions(self):
+        "Aspirates, dispenses and blow outs the plan will make"
+        return sum(1 + len(p.dispenses) + (p.volume > sum(d.volume for d in p.dispenses)) for p in self.passes)
+
+    def report(self):
+        return {"passes": len(self.passes), "predicted_motions": self.motions,
+                "baseline_motions": self.baseline_motions,
+                "saved": 1 - self.motions / self.baseline_motions if self.baseline_motions else 0.0}
+
+
+def plan_transfers(jobs, pipette, disposal_volume=0):
+    """Plans a list of (source, destination, volume) jobs as multi-dispense passes.
+
+    Sources and destinations can be tracked containers (falcon_tube_15 etc.), wells or locations, like
+    tracked_transfer(). Jobs keep their order, only consecutive jobs from the same source share a pass, and a job
+    is never split between passes beyond the full max_volume chunks tracked_transfer() would make too.
+    'disposal_volume' is extra liquid aspirated with each multi-dispense pass and blown back into the source.
+    Nothing is moved and no tracked volume is changed until execute_plan().
+    """
+    capacity = pipette.max_volume - disposal_volume
+    volumes = {}  # id(tracked container) -> volume it will have at this point of the plan
+    passes, baseline = [], 0
+
+    def track(container, change):
+        key = id(container)
+        volumes[key] = volumes.get(key, container.current_volume) + change
+        if change < 0 and volumes[key] < container.minimum_volume:
+            raise ValueError(f"{container.label or container.location} would run dry")
+        if change > 0 and volumes[key] > container.maximum_volume:
+            raise ValueError(f"{container.label or container.location} would overflow")
+        return volumes[key]
+
+    def close(source, dispenses):
+        dispensed = sum(d.volume for d in dispenses)
+        extra = disposal_volume if len(dispenses) > 1 else 0
+        height = None
+        if _is_tracked(source):
+            height = _level_at(source, track(source, -dispensed - extra))
+            track(source, extra)  # The disposal volume goes back in
+        passes.append(Pass(source, dispensed + extra, height, dispenses))
+
+    def dispense(destination, volume):
+        height = _level_at(destination, track(destination, volume), default=3) if _is_tracked(destination) else None
+        return Dispense(destination, volume, height)
+
+    current_source, dispenses, room = None, [], 0
+    for source, destination, volume in jobs:
+        n_full = int(volume / pipette.max_volume)
+        remainder = volume - n_full * pipette.max_volume
+        baseline += 2 * (n_full + (remainder > 0))
+        if dispenses and (source is not current_source or n_full or remainder > room):
+            close(current_source, dispenses)
+            dispenses, room = [], capacity
+        current_source = source
+        for _ in range(n_full):  # Full tips go straight across, like tracked_transfer()
+            close(source, [dispense(destination, pipette.max_volume)])
+        if remainder > 0:
+            if not dispenses:
+                room = capacity
+            dispenses.append(dispense(destination, remainder))
+            room -= remainder  # A lone dispense needs no disposal volume, so this can go below 0
+    if dispenses:
+        close(current_source, dispenses)
+    return TransferPlan(passes, baseline)
+
+
+def execute_plan(plan, pipette):
+    "Runs a TransferPlan with the tip already on the pipette, updating the tracked containers as it goes"
+    for p in plan.passes:
+        source_loc = _location(p.source)
+        pipette.aspirate(p.volume, _at_height(source_loc, p.height))
+        if _is_tracked(p.source):
+            p.source.subtract_volume(p.volume)
+        for d in p.dispenses:
+            pipette.dispense(d.volume, _at_height(_location(d.destination), d.height))
+            if _is_tracked(d.destination):
+                d.destination.add_volume(d.volume)
+        leftover = p.volume - sum(d.volume for d in p.dispenses)
+        if leftover > 0:
+            pipette.blow_out(source_loc.top() if isinstance(source_loc, Well) else source_loc)
+            if _is_tracked(p.source):
+                p.source.add_volume(leftover)
+    return plan.report()
+
+
+def batched_transfer(jobs, pipette, disposal_volume=0):
+    "plan_transfers() then execute_plan(), returning the predicted vs baseline motion report"
+    return execute_plan(plan_transfers(jobs, pipette, disposal_volume), pipette)
+
+
 # Example 
 # Example Usage
 
@@ -214,5 +321,20 @@ def run(protocol):
             break
     pipette300.return_tip()
 
-protocol = opentrons.simulate.get_protocol_api("2.12")
-run(protocol)
+
+def run_batched(protocol):
+    # Fill a plate from a Falcon tube, planned as multi-dispense passes instead of one round trip per well
+    tips300 = protocol.load_labware("opentrons_96_filtertiprack_200ul", 5)
+    tube_rack = protocol.load_labware("opentrons_10_tuberack_falcon_4x50ml_6x15ml_conical", 3)
+    plate = protocol.load_labware("corning_96_wellplate_360ul_flat", 2)
+    reservoir = falcon_tube_50(protocol, 40_000, tube_rack['A3'])
+    pipette300 = protocol.load_instrument("p300_single", "right", tip_racks=[tips300])
+
+    pipette300.pick_up_tip()
+    print(batched_transfer([(reservoir, well, 50) for well in plate.wells()], pipette300, disposal_volume=20))
+    pipette300.return_tip()
+
+
+if __name__ == "__main__":
+    protocol = opentrons.simulate.get_protocol_api("2.12")
+    run(protocol)
@@ -0,0 +1,181 @@
+"""
+Keeps track of the volume in every well on the deck, for plates as well as the Falcon tubes in
+falcon_liquid_tracking.py.
+
+Volumes, minimums and maximums for everything registered are kept in flat NumPy arrays, with each well or tracked
+container mapped to a position once when it is registered. A whole batch of transfers is checked in one go
+(running totals per container, in the order the transfers happen) and is either applied completely or not at all,
+so you find out which container would run dry or overflow, and at which step, before the robot moves.
+Every applied batch is logged, so the volume of everything over the run can be exported as a timeline.
+
+    inventory = LiquidInventory()
+    inventory.register(plate, 0, maximum=360)
+    inventory.register(reservoir)  # A tracked_container, keeps its own limits and is kept in step
+    inventory.apply([(reservoir, well, 50) for well in plate.wells()])
+    inventory.export_timeline("volumes.csv")
+
+I am not responsible for any damage done to your labware.
+"""
+
+import csv
+from collections import namedtuple
+
+import numpy as np
+
+Violation = namedtuple("Violation", ["container", "step", "volume", "limit", "kind"])  # kind: underflow/overflow
+
+
+class InventoryError(ValueError):
+    def __init__(self, violations):
+        self.violations = violations
+        lines = [f"step {v.step}: {v.container} would {'run dry' if v.kind == 'underflow' else 'overflow'} "
+                 f"({v.volume:g} ul, limit {v.limit:g} ul)" for v in violations[:10]]
+        more = f"\n... and {len(violations) - 10} more" if len(violations) > 10 else ""
+        super().__init__("Transfers not applied:\n" + "\n".join(lines) + more)
+
+
+class LiquidInventory:
+    def __init__(self):
+        self.names = []
+        self.volume = np.zeros(0)
+        self.minimum = np.zeros(0)
+        self.maximum = np.zeros(0)
+        self.steps = 0  # Transfers applied so far
+        self._index = {}  # id(well or tracked container) -> position in the arrays
+        self._targets = []  # What was registered, held so no id in _index can be reused by a new object
+        self._containers = {}  # position -> tracked container, whose current_volume is kept in step
+        self._start = None  # Volumes before the first transfer, for the timeline
+        self._log = []  # (positions, changes) per applied batch, one row per transfer
+
+    def register(self, target, volume=None, minimum=None, maximum=None):
+        """Adds a labware (every well), a single well or a tracked_container.
+
+        'volume', 'minimum' and 'maximum' (ul) can be single numbers or one per well, and default to 0, 0 and no
+        limit. Tracked containers bring their own volume and limits for any that aren't given. Nothing is added if
+        anything in 'target' is already registered.
+        """
+        if self.steps:
+            raise RuntimeError("Register everything before applying transfers, so the timeline lines up")
+        if hasattr(target, "current_volume"):  # Tracked container
+            targets = [target]
+            names = [target.label or str(target.location)]
+            rows = [[target.current_volume if volume is None else volume,
+                     target.minimum_volume if minimum is None else minimum,
+                     target.maximum_volume if maximum is None else maximum]]
+        else:
+            targets = list(target.wells()) if hasattr(target, "wells") else [target]
+            names = [str(well) for well in targets]
+            rows = np.stack([np.broadcast_to(np.asarray(default if value is None else value, dtype=float),
+                                             (len(targets),))
+                             for value, default in ((volume, 0), (minimum, 0), (maximum, np.inf))], axis=1)
+        if not targets:
+            return
+        keys, seen = [id(item) for item in targets], set()
+        for key, name in zip(keys, names):  # Check everything before changing anything
+            if key in self._index or key in seen:
+                raise ValueError(f"{name} is already registered")
+            seen.add(key)
+        first = len(self.names)
+        self._index.update((key, first + i) for i, key in enumerate(keys))
+        self.names.extend(names)
+        self._targets.extend(targets)
+        if hasattr(target, "current_volume"):
+            self._containers[first] = target
+        volumes, minimums, maximums = np.asarray(rows, dtype=float).reshape(-1, 3).T
+        self.volume = np.concatenate([self.volume, volumes])
+        self.minimum = np.concatenate([self.minimum, minimums])
+        self.maximum = np.concatenate([self.maximum, maximums])
+
+    def index(self, target) -> int:
+        "Position of a well, tracked container or Location in the arrays"
+        key = id(target)
+        if key not in self._index and hasattr(target, "labware"):  # A Location, use the well it points at
+            key = id(target.labware.as_well())
+        try:
+            return self._index[key]
+        except KeyError:
+            raise KeyError(f"{target} is not registered") from None
+
+    def volume_of(self, target) -> float:
+        return float(self.volume[self.index(target)])
+
+    def volumes_of(self, labware) -> np.ndarray:
+        "Current volume of each well of a labware, in labware.wells() order"
+        return self.volume[[self.index(well) for well in labware.wells()]]
+
+    def _arrays(self, transfers):
+        """(sources, destinations, volumes) arrays from (source, destination, volume) tuples or a TransferPlan
+        (from falcon_liquid_tracking.py)"""
+        if hasattr(transfers, "passes"):
+            transfers = [(p.source, d.destination, d.volume) for p in transfers.passes for d in p.dispenses]
+        transfers = list(transfers)
+        sources = np.fromiter((self.index(t[0]) for t in transfers), dtype=np.intp, count=len(transfers))
+        destinations = np.fromiter((self.index(t[1]) for t in transfers), dtype=np.intp, count=len(transfers))
+        volumes = np.fromiter((t[2] for t in transfers), dtype=float, count=len(transfers))
+        if np.any(volumes <= 0):
+            raise ValueError("Transfer volumes must be positive")
+        return sources, destinations, volumes
+
+    def _running(self, sources, destinations, volumes):
+        """Every container's volume after each change of a batch: (positions, steps, volumes after), sorted by
+        position and then step, so each container's changes are in the order they happen"""
+        n = len(volumes)
+        positions = np.concatenate([sources, destinations])
+        steps = np.concatenate([np.arange(n), np.arange(n)])
+        changes = np.concatenate([-volumes, volumes])
+        order = np.lexsort((changes, steps, positions))  # Within a step, take out before putting in
+        positions, steps, changes = positions[order], steps[order], changes[order]
+        totals = np.cumsum(changes)
+        starts = np.flatnonzero(np.r_[True, positions[1:] != positions[:-1]])
+        before = np.repeat(totals[starts] - changes[starts], np.diff(np.r_[starts, len(positions)]))
+        return positions, steps, self.volume[positions] + totals - before
+
+    def check(self, transfers) -> list:
+        "Violations a batch of transfers would cause, without applying it"
+        return self._check(*self._arrays(transfers))
+
+    def _check(self, sources, destinations, volumes):
+        positions, steps, running = self._running(sources, destinations, volumes)
+        violations = []
+        for kind, bad, limits in (("underflow", running < self.minimum[positions], self.minimum),
+                                  ("overflow", running > self.maximum[positions], self.maximum)):
+            for i in np.flatnonzero(bad):
+                violations.append(Violation(self.names[positions[i]], self.steps + int(steps[i]),
+                                            float(running[i]), float(limits[positions[i]]), kind))
+        return sorted(violations, key=lambda v: v.step)
+
+    def apply(self, transfers):
+        """Applies a batch of (source, destination, volume) transfers (or a TransferPlan) all at once, or raises
+        InventoryError listing every violation and changes nothing"""
+        sources, destinations, volumes = self._arrays(transfers)
+        violations = self._check(sources, destinations, volumes)
+        if violations:
+            raise InventoryError(violations)
+        if self._start is None:
+            self._start = self.volume.copy()
+        size = len(self.volume)
+        self.volume = self.volume + np.bincount(destinations, volumes, size) - np.bincount(sources, volumes, size)
+        self.steps += len(volumes)
+        self._log.append((sources, destinations, volumes))
+        for position, container in self._containers.items():
+            container.current_volume = float(self.volume[position])
+
+    def timeline(self) -> np.ndarray:
+        "Volume of every container after each applied transfer, shape (steps + 1, containers), starting volumes first"
+        start = self.volume if self._start is None else self._start
+        changes = np.zeros((self.steps + 1, len(start)))
+        step = 1
+        for sources, destinations, volumes in self._log:
+            rows = np.arange(step, step + len(volumes))
+            np.add.at(changes, (rows, sources), -volumes)
+            np.add.at(changes, (rows, destinations), volumes)
+            step += len(volumes)
+        return start + np.cumsum(changes, axis=0)
+
+    def export_timeline(self, path):
+        "Writes timeline() as CSV, one row per step and one column per container"
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["step"] + self.names)
+            for step, row in enumerate(self.timeline()):
+                writer.writerow([step] + [f"{volume:g}" for volume in row])
@@ -0,0 +1,168 @@
+"""
+Ways for CustomPipette (Replace_Pipette_Tips.py) to get more tips when it runs out, without stopping the deck
+every time.
+
+A refill strategy is called with the pipette when no tracked rack has a tip left, and returns the (rack, well) to
+pick up from next, or None to let the next strategy have a go. Strategies can also watch each pickup (on_pickup),
+so they can ask for a refill before the tips are actually gone. The usual set up is:
+
+    RefillChain(SpareRacks([spare_rack]),        # Move on to a full rack in another slot
+                QueuedRefill(notify=callback),   # Ask someone to refill the empty racks while the protocol goes on
+                PromptRefill(protocol.pause))    # Only stop and wait if there is really nothing else
+
+RefillChain times each call and keeps a log of it, so you can see how long the robot sat waiting for tips and size
+the tip inventory from that.
+
+Needs tip_tracker.py next to it. I am not responsible for any damage that may occur to your equipment.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+TipWait = namedtuple("TipWait", ["strategy", "seconds", "resolved", "timestamp"])
+
+
+class RefillStrategy:
+    """Base class. Subclasses override __call__, and on_pickup if they want to see tips being used."""
+
+    def __call__(self, pipette):
+        return None
+
+    def on_pickup(self, pipette):
+        pass
+
+    def __repr__(self):
+        return type(self).__name__
+
+
+class SpareRacks(RefillStrategy):
+    def __init__(self, racks):
+        """Full tip racks loaded in other slots, brought into use in order once the pipette's racks are empty."""
+        self.spares = list(racks)
+
+    def __call__(self, pipette):
+        while self.spares:
+            rack = self.spares.pop(0)
+            pipette.tip_racks.append(rack)
+            pipette.tip_tracker.add(rack)
+            found = pipette.tip_tracker.next_tip(pipette.channels, racks=[rack])
+            if found:
+                return found
+        return None
+
+
+class QueuedRefill(RefillStrategy):
+    def __init__(self, notify=print, low_water=0, timeout=0.0):
+        """Asks for empty racks to be refilled without pausing, via notify(list of racks).
+
+        A request goes out as soon as a rack is emptied, or for every rack that isn't full once there are
+        'low_water' tips or fewer left in total. Whoever refills them calls confirm() (safe from another thread),
+        and the racks are marked full at the next pickup. If the pipette runs out first, this waits up to 'timeout'
+        seconds for a confirmation before handing over to the next strategy. Racks refilled some other way (e.g. by
+        PromptRefill or tracker.refill()) stop counting as requested, so they are asked for again next time.
+        """
+        self.notify = notify
+        self.low_water = low_water
+        self.timeout = timeout
+        self.requested = []  # Racks asked for but not yet confirmed or otherwise refilled
+        self._requested_at = {}  # id(rack) -> the tracker's refill count for it when it was asked for
+        self._confirmed = []
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+
+    def confirm(self, racks=None):
+        """Marks 'racks' (or everything requested so far) as refilled. Can be called from any thread."""
+        with self._lock:
+            self._confirmed.extend(self.requested if racks is None else racks)
+            self._event.set()
+
+    def _apply(self, pipette):
+        """Refills the confirmed racks in the tracker, on the protocol's own thread."""
+        with self._lock:
+            confirmed, self._confirmed = self._confirmed, []
+            self._event.clear()
+        for rack in confirmed:
+            pipette.tip_tracker.refill(rack)
+        self._forget_refilled(pipette.tip_tracker)
+        return confirmed
+
+    def _forget_refilled(self, tracker):
+        """Drops requested racks the tracker has refilled since they were asked for, however that happened."""
+        with self._lock:
+            self.requested = [rack for rack in self.requested
+                              if rack not in tracker or tracker.refill_count(rack) == self._requested_at[id(rack)]]
+
+    def _request(self, tracker, racks):
+        with self._lock:
+            racks = [rack for rack in racks if rack not in self.requested]
+            self.requested.extend(racks)
+            self._requested_at.update((id(rack), tracker.refill_count(rack)) for rack in racks)
+        if racks:
+            self.notify(racks)
+
+    def on_pickup(self, pipette):
+        tracker = pipette.tip_tracker
+        self._apply(pipette)
+        if tracker.tips_left() <= self.low_water:
+            self._request(tracker, [rack for rack in tracker.racks if tracker.tips_left(rack) < tracker.capacity(rack)])
+        else:
+            self._request(tracker, [rack for rack in tracker.racks if not tracker.tips_left(rack)])
+
+    def __call__(self, pipette):
+        self._forget_refilled(pipette.tip_tracker)
+        self._request(pipette.tip_tracker, pipette.tip_tracker.racks)
+        if not self._apply(pipette) and self.timeout and self._event.wait(self.timeout):
+            self._apply(pipette)
+        return pipette.tip_tracker.next_tip(pipette.channels)
+
+
+class PromptRefill(RefillStrategy):
+    def __init__(self, pause=None):
+        """Stops until the operator has refilled every rack: through pause(message) (e.g. protocol.pause) if given,
+        otherwise by waiting for Enter (which assumes jupyter notebook or a terminal)."""
+        self.pause = pause
+
+    def __call__(self, pipette):
+        message = "Please replace the following tip boxes: " + ", ".join(str(box) for box in pipette.tip_racks)
+        if self.pause is not None:
+            self.pause(message)
+        else:
+            print(message)
+            input('Press Enter When Finished')
+        pipette.tip_tracker.refill()
+        print('Done refilling tip boxes')
+        return pipette.tip_tracker.next_tip(pipette.channels)
+
+
+class RefillChain(RefillStrategy):
+    def __init__(self, *strategies, clock=time.monotonic):
+        """Tries each strategy in turn until one comes up with a tip, logging the time spent as TipWait entries."""
+        self.strategies = strategies
+        self.clock = clock
+        self.waits = []
+
+    def on_pickup(self, pipette):
+        for strategy in self.strategies:
+            strategy.on_pickup(pipette)
+
+    def __call__(self, pipette):
+        for strategy in self.strategies:
+            start = self.clock()
+            found = strategy(pipette)
+            self.waits.append(TipWait(repr(strategy), self.clock() - start, bool(found), time.time()))
+            if found:
+                return found
+        return None
+
+    def wait_time(self, strategy=None) -> float:
+        """Total seconds spent getting tips, optionally for one kind of strategy (by name, e.g. "PromptRefill")."""
+        return sum(wait.seconds for wait in self.waits if strategy is None or wait.strategy == strategy)
+
+    def summary(self) -> dict:
+        """{strategy name: (times called, times it found a tip, seconds spent)}"""
+        totals = {}
+        for wait in self.waits:
+            calls, resolved, seconds = totals.get(wait.strategy, (0, 0, 0.0))
+            totals[wait.strategy] = (calls + 1, resolved + wait.resolved, seconds + wait.seconds)
+        return totals
@@ -0,0 +1,158 @@
+"""
+Keeps track of which tips are left in a set of tip racks without walking every well each time.
+
+Each rack is stored as one bitmask per column (bit 0 is row A), with the well name to position lookup worked out
+once when the tracker is made. Finding the next tip for a single or multi-channel pickup, or using/refilling a
+whole run of tips, is then a few integer operations per column instead of a scan through Well objects.
+Changes are copied to the wells' has_tip flags as they happen, so the rest of the Opentrons API stays in step.
+
+Used by Partially_Empty_Tipbox.py and Replace_Pipette_Tips.py, keep it next to them.
+
+I am not responsible for any damage done to your labware.
+"""
+
+
+class TipTracker:
+    def __init__(self, racks, auto_sync=True):
+        """Tracks 'racks', starting from their current has_tip flags.
+
+        With auto_sync off, call sync() yourself to push the tracked state back to the wells.
+        """
+        self.racks = []
+        self.auto_sync = auto_sync
+        self._rack_index = {}
+        self._columns = []  # [rack][column] -> list of wells, top to bottom
+        self._positions = []  # [rack] -> {well name: (column, row)}
+        self._masks = []  # [rack][column] -> bitmask of rows that still have a tip
+        self._sizes = []  # [rack] -> number of wells
+        self._refills = []  # [rack] -> times refill() has been called on it
+        self._first_rack = 0  # No rack before this one has any tips left
+        for rack in racks:
+            self.add(rack)
+
+    def add(self, rack):
+        """Starts tracking another rack (e.g. a spare brought into use), from its current has_tip flags."""
+        if rack in self:
+            return
+        self._rack_index[id(rack)] = len(self.racks)
+        self.racks.append(rack)
+        columns = [list(column) for column in rack.columns()]
+        self._columns.append(columns)
+        self._positions.append({well.well_name: (c, r) for c, column in enumerate(columns)
+                                for r, well in enumerate(column)})
+        self._masks.append([sum(1 << r for r, well in enumerate(column) if well.has_tip) for column in columns])
+        self._sizes.append(sum(len(column) for column in columns))
+        self._refills.append(0)
+
+    def __contains__(self, rack) -> bool:
+        return id(rack) in self._rack_index
+
+    def _locate(self, well):
+        """(rack index, column, row) of a tracked well."""
+        rack = self._rack_index.get(id(well.parent))
+        if rack is None:
+            raise ValueError(f"{well} is not in a tracked tip rack")
+        return (rack,) + self._positions[rack][well.well_name]
+
+    def _set(self, rack, column, rows_mask, has_tip):
+        """Sets the tip state of the rows in 'rows_mask' of one column, copying it to the wells if auto syncing."""
+        if has_tip:
+            self._masks[rack][column] |= rows_mask
+            self._first_rack = min(self._first_rack, rack)
+        else:
+            self._masks[rack][column] &= ~rows_mask
+        if self.auto_sync:
+            for row, well in enumerate(self._columns[rack][column]):
+                if rows_mask >> row & 1:
+                    well.has_tip = has_tip
+
+    def _range(self, rack, first, count, has_tip):
+        """Sets 'count' tips from the 'first'th (column major, like rack.wells()) onwards a column at a time."""
+        columns = self._columns[rack]
+        while count > 0 and first < self._sizes[rack]:
+            column, row = divmod(first, len(columns[0]))
+            rows = min(count, len(columns[column]) - row)
+            self._set(rack, column, ((1 << rows) - 1) << row, has_tip)
+            first += rows
+            count -= rows
+
+    def has_tip(self, well) -> bool:
+        rack, column, row = self._locate(well)
+        return bool(self._masks[rack][column] >> row & 1)
+
+    def tips_left(self, rack=None) -> int:
+        """Tips left in one rack, or all of them."""
+        racks = range(len(self.racks)) if rack is None else [self._rack_index[id(rack)]]
+        return sum(bin(mask).count("1") for i in racks for mask in self._masks[i])
+
+    def capacity(self, rack) -> int:
+        """Number of wells in a tracked rack, without asking the rack for them again."""
+        return self._sizes[self._rack_index[id(rack)]]
+
+    def refill_count(self, rack) -> int:
+        """How many times a rack has been refilled, so others can tell whether it happened since they last looked."""
+        return self._refills[self._rack_index[id(rack)]]
+
+    def next_tip(self, channels=1, start=None, racks=None):
+        """(rack, well) where a pipette with 'channels' tips would pick up next, or None if there is nowhere.
+
+        Like Labware.next_tip(), multi-channel pickups need that many tips in a row down one column.
+        'start' is a well to start looking from, skipping earlier racks and wells. 'racks' limits the search to
+        some of the tracked racks.
+        """
+        first_rack, first_column, first_row = self._locate(start) if start is not None else (self._first_rack, 0, 0)
+        allowed = None if racks is None else {self._rack_index[id(rack)] for rack in racks}
+        for rack in range(first_rack, len(self.racks)):
+            masks = self._masks[rack]
+            if start is None and rack == self._first_rack and not any(masks):
+                self._first_rack += 1  # Emptied racks are skipped for good, until a refill
+                continue
+            if allowed is not None and rack not in allowed:
+                continue
+            for column in range(first_column if rack == first_rack else 0, len(masks)):
+                mask = masks[column]
+                if rack == first_rack and column == first_column:
+                    mask &= ~((1 << first_row) - 1)
+                runs = mask  # Bit r stays set only if rows r to r + channels - 1 all have tips
+                for shift in range(1, channels):
+                    runs &= mask >> shift
+                if runs:
+                    row = (runs & -runs).bit_length() - 1
+                    return self.racks[rack], self._columns[rack][column][row]
+        return None
+
+    def use(self, well, channels=1):
+        """Marks the tip at 'well', and the channels - 1 below it, as used."""
+        rack, column, row = self._locate(well)
+        self._set(rack, column, ((1 << channels) - 1) << row, False)
+
+    def pick(self, channels=1, start=None):
+        """next_tip() and use() in one go, returning (rack, well) or None."""
+        found = self.next_tip(channels, start)
+        if found is not None:
+            self.use(found[1], channels)
+        return found
+
+    def mark_used(self, rack, number_of_tips):
+        """Empties the first 'number_of_tips' wells of a rack, in rack.wells() order."""
+        self._range(self._rack_index[id(rack)], 0, number_of_tips, False)
+
+    def mark_used_before(self, rack, well_name):
+        """Empties every well of a rack before 'well_name', so it is where the next pickup happens."""
+        column, row = self._positions[self._rack_index[id(rack)]][well_name]
+        self.mark_used(rack, column * len(self._columns[self._rack_index[id(rack)]][0]) + row)
+
+    def refill(self, rack=None, missing_tips=0):
+        """Fills a rack (or every rack), leaving its first 'missing_tips' wells empty."""
+        for target in ([rack] if rack is not None else self.racks):
+            index = self._rack_index[id(target)]
+            self._refills[index] += 1
+            self._range(index, 0, missing_tips, False)
+            self._range(index, missing_tips, self._sizes[index] - missing_tips, True)
+
+    def sync(self, rack=None):
+        """Copies the tracked state onto every well's has_tip flag, for one rack or all of them."""
+        for index in (range(len(self.racks)) if rack is None else [self._rack_index[id(rack)]]):
+            for column, wells in enumerate(self._columns[index]):
+                for row, well in enumerate(wells):
+                    well.has_tip = bool(self._masks[index][column] >> row & 1)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+LAB_THINGS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, LAB_THINGS)
+sys.path.insert(0, os.path.join(LAB_THINGS, "opentrons_snippets"))
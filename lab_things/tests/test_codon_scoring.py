@@ -0,0 +1,24 @@
+import math
+import warnings
+
+import pytest
+
+from codon_scoring import relative_adaptiveness, score_batch
+
+TABLE = {"K": {"AAA": 1.0, "AAG": 0.0}, "F": {"TTT": .5, "TTC": .5}}
+
+
+def test_unused_codons_lower_cai_and_count_as_rare():
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # The table leaves most codons out on purpose
+        common, unused, unlisted = score_batch(["AAAAAA", "AAAAAG", "AAAGGG"], TABLE, min_w=.01)
+    assert common.cai == 1.0
+    assert math.isclose(unused.cai, .1) and math.isclose(unlisted.cai, .1)
+    assert unused.rare_fraction == unlisted.rare_fraction == .5
+    assert list(relative_adaptiveness("AAGNNN", TABLE, min_w=.01)[:1]) == [.01]
+
+
+def test_short_sequences_and_bad_windows():
+    assert score_batch(["AAA"], TABLE, window=2)[0][-2:] == (-1, -1)
+    with pytest.raises(ValueError):
+        score_batch(["AAA"], TABLE, window=0)
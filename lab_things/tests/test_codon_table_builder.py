@@ -0,0 +1,15 @@
+import codon_table_builder
+from codon_table_builder import count_codons
+
+
+def test_counts_do_not_depend_on_block_boundaries(tmp_path, monkeypatch):
+    path = tmp_path / "cds.fa"
+    path.write_bytes(b">a ribosomal protein\r\nATGAAA\r\nGGGTAA\r\n>b partial\nATGAA\n>c internal stop\nATGTAAAAATAA\n"
+                     b">d\n" + b"ATG" + b"GCT" * 1000 + b"TGA\n")
+    expected = count_codons(path)
+    assert expected[1:] == (2, 2)
+    assert expected[0]["GCT"] == 1000 and expected[0]["AAA"] == 1
+    for block_size in (1, 2, 5, 64):
+        monkeypatch.setattr(codon_table_builder, "_BLOCK_SIZE", block_size)
+        assert count_codons(path) == expected
+        assert count_codons(path, workers=2) == expected
@@ -0,0 +1,22 @@
+from thermocycler import RenderCache, estimate_runtime, estimate_runtimes, parse_program, render_batch
+
+
+def test_render_cache_key_tells_drawings_apart():
+    # One cycle brackets are drawn as their own stage, and times aren't rounded when drawn
+    for first, second in (("1[ 95/0:30 ] 72/1:00", "95/0:30 72/1:00"), ("95/0:30.4", "95/0:30")):
+        assert RenderCache.key(parse_program(first)) != RenderCache.key(parse_program(second))
+
+
+def test_render_batch_renders_bracketed_single_cycles_separately(tmp_path):
+    programs = [("bracketed", "1[ 95/0:30 ] 72/1:00"), ("flat", "95/0:30 72/1:00")]
+    reports = render_batch(programs, str(tmp_path), image_format="svg", workers=1)
+    assert [report["duplicate_of"] for report in reports] == [None, None]
+    assert (tmp_path / "bracketed.svg").read_bytes() != (tmp_path / "flat.svg").read_bytes()
+
+
+def test_zero_cycle_stages_add_no_runtime():
+    with_empty_stage = estimate_runtime("95/3:00 0[ 60/0:30 72/0:30 ] 4/1:00")
+    without = estimate_runtime("95/3:00 4/1:00")
+    assert with_empty_stage.total_seconds == without.total_seconds
+    assert with_empty_stage.stage_seconds[1] == 0
+    assert estimate_runtimes(["0[ 95/0:30 ]"])[0] == 0
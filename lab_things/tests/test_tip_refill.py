@@ -0,0 +1,61 @@
+from tip_refill import PromptRefill, QueuedRefill, RefillChain
+from tip_tracker import TipTracker
+
+
+class Well:
+    """Stand-in for an Opentrons Well."""
+
+    def __init__(self, parent, name):
+        self.parent, self.well_name, self.has_tip = parent, name, True
+
+
+class Rack:
+    """Stand-in 8 x 12 tip rack."""
+
+    def __init__(self):
+        self._columns = [[Well(self, f"{row}{column}") for row in "ABCDEFGH"] for column in range(1, 13)]
+
+    def columns(self):
+        return self._columns
+
+    def wells(self):
+        return [well for column in self._columns for well in column]
+
+
+class Pipette:
+    """Just enough of CustomPipette for the refill strategies."""
+
+    def __init__(self, racks, strategy, channels=1):
+        self.tip_racks, self.channels, self.refill_strategy = racks, channels, strategy
+        self.tip_tracker = TipTracker(racks)
+
+    def pick_up_tip(self):
+        found = self.tip_tracker.next_tip(self.channels) or self.refill_strategy(self)
+        assert found, "out of tips"
+        self.tip_tracker.use(found[1], self.channels)
+        self.refill_strategy.on_pickup(self)
+
+
+def test_queued_refill_asks_again_after_a_prompted_refill():
+    notified, pauses = [], []
+    chain = RefillChain(QueuedRefill(notify=notified.append), PromptRefill(pause=pauses.append))
+    rack = Rack()
+    pipette = Pipette([rack], chain)
+    for _ in range(96 * 3):
+        pipette.pick_up_tip()
+    # The rack empties three times and each time is asked for, not just the first before falling through to pauses
+    assert len(notified) == 3 and len(pauses) == 2
+    assert all(racks == [rack] for racks in notified)
+
+
+def test_queued_refill_forgets_racks_refilled_through_the_tracker():
+    notified = []
+    queued = QueuedRefill(notify=notified.append)
+    rack = Rack()
+    pipette = Pipette([rack], RefillChain(queued, PromptRefill(pause=lambda message: None)))
+    for _ in range(96):
+        pipette.pick_up_tip()
+    assert queued.requested == [rack]
+    pipette.tip_tracker.refill(rack)
+    pipette.pick_up_tip()
+    assert queued.requested == []
@@ -1,101 +1,537 @@
 """
 Generates a nice looking thermocycler program schematic for input into a lab notebook or presentation
-Requires python 3ish, PILLOW
+Requires python 3ish, PILLOW (only for PNG output)
+
+render() gives PNG or SVG bytes sized to the program, and is what to use from scripts and services.
+pcr_image() is the original quick way to look at one: it opens a viewer and saves img.png.
+estimate_runtime() and estimate_runtimes() work out how long programs take with ramping, for scheduling, and
+temperature_trace() samples the block temperature over a run.
+render_batch() renders a whole file of programs in parallel, also from the command line:
+    python thermocycler.py programs.txt -o schematics.zip
 @author: croots
 @version: 0.3
 """
 
-import PIL
-from PIL import ImageDraw, ImageFont
-
-def pcr_image(program):
-    # Decode String
-    program_string = program
-    program = program.split(" ")
-    encoded_program = {}
-    encoded_program["1"] = {}
-    current_subprogram = 1
-    subprograms = 1
-    for step in program:
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+from typing import NamedTuple, Tuple
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class Step(NamedTuple):
+    temperature: float  # Celsius
+    seconds: float  # 0 means hold until stopped
+
+
+class Stage(NamedTuple):
+    cycles: int
+    steps: Tuple[Step, ...]
+
+
+class Program(NamedTuple):
+    stages: Tuple[Stage, ...]
+
+    @property
+    def temperatures(self) -> Tuple[float, ...]:
+        """Every temperature used, hottest first, which is the order they are drawn top to bottom."""
+        return tuple(sorted({step.temperature for stage in self.stages for step in stage.steps}, reverse=True))
+
+    def normalized(self) -> str:
+        """Canonical program string, equal for any two programs that run the same way."""
+        parts = []
+        for stage in self.stages:
+            steps = " ".join(f"{_format_temperature(step.temperature)}/{_format_time(step.seconds)}" for step in stage.steps)
+            parts.append(f"{stage.cycles}[ {steps} ]" if stage.cycles != 1 else steps)
+        return " ".join(parts)
+
+
+def _format_temperature(temperature):
+    return f"{temperature:g}"
+
+
+def _format_time(seconds):
+    """m:ss (or h:mm:ss), the way times are written in program strings."""
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def _parse_time(text):
+    """Seconds in 'm:ss', 'h:mm:ss' or whole minutes ('2')."""
+    seconds = 0.0
+    for part in text.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds * 60 if ":" not in text else seconds
+
+
+def parse_program(program) -> Program:
+    """Decodes a program string like "98/0:30 32[ 98/0:20 55/0:20 72/0:40 ] 72/2 4/0:00" into a Program.
+
+    Steps are temperature/time. 'N[ ... ]' repeats the steps inside N times, and steps outside brackets run once,
+    consecutive ones sharing a stage. Times are m:ss, h:mm:ss or whole minutes, and 0:00 holds indefinitely.
+    """
+    stages = []
+    cycles, steps, bracketed = 1, [], False
+
+    def _close():
+        if steps:
+            stages.append(Stage(cycles, tuple(steps)))
+
+    for step in program.split(" "):
         if "" == step:
             continue
         elif "/" in step:
-            if "cycles" not in encoded_program[f"{current_subprogram}"].keys():
-                encoded_program[f"{current_subprogram}"] = {}
-                encoded_program[f"{current_subprogram}"]["cycles"] = 1
-                encoded_program[f"{current_subprogram}"]["steps"] = []
-            encoded_program[f"{current_subprogram}"]["steps"].append(step.split("/"))
-            continue
-        elif "[" in step or "]" in step:
-            if "cycles" in encoded_program[f"{current_subprogram}"].keys():
-                current_subprogram += 1
-                subprograms += 1
-                encoded_program[f"{current_subprogram}"] = {}
-            if "[" in step:
-                try:
-                    encoded_program[f"{current_subprogram}"] = {}
-                    encoded_program[f"{current_subprogram}"]["cycles"] = int(step[:-1])
-                    encoded_program[f"{current_subprogram}"]["steps"] = []
-                    continue
-                except:
-                    pass
-            elif "]" == step:
+            try:
+                temperature, hold = step.split("/")
+                steps.append(Step(float(temperature), _parse_time(hold)))
+                continue
+            except ValueError:
+                pass
+        elif step.endswith("[") and not bracketed:
+            try:
+                new_cycles = int(step[:-1])
+                _close()
+                cycles, steps, bracketed = new_cycles, [], True
                 continue
+            except ValueError:
+                pass
+        elif "]" == step and bracketed:
+            _close()
+            cycles, steps, bracketed = 1, [], False
+            continue
         raise ValueError(f"Unrecognized Step {step}.")
-    # Clean up if the last subprogram has no steps
-    if "cycles" not in encoded_program[f"{subprograms}"].keys():
-        del(encoded_program[f"{subprograms}"])
-    # Find unique temperatures
-    unique_temperatures = []
-    for sub_program in encoded_program:
-        for step in encoded_program[f"{sub_program}"]["steps"]:
-            if step[0] not in unique_temperatures:
-                unique_temperatures.append(step[0])
-    ordered_temperatures = []
-    if len(unique_temperatures) > 1:
-        for temperature in unique_temperatures:
-            for i, ordered_temperature in enumerate(ordered_temperatures):
-                if int(temperature) > int(ordered_temperature):
-                    ordered_temperatures = ordered_temperatures[:i] + [temperature] + ordered_temperatures[i:]
-                    continue
-            if temperature not in ordered_temperatures:
-                ordered_temperatures.append(temperature)
-    else:
-        ordered_temperatures = unique_temperatures
-    ordered_temperatures=tuple(ordered_temperatures)
-    # Draw Image
-    imgwidth = 7000
-    imgheight = 700+100*ordered_temperatures.index(step[0])
-    img = PIL.Image.new('RGB', (imgwidth, imgheight), color = 'white')
-    pcr_diagram = PIL.ImageDraw.Draw(img)
-    current_position = [0,5]
-    line_ends = []
-    text_color = (50,50,50)
-    line_color = (150,150,150)
-    font = ImageFont.truetype("arial.ttf", 60)
-    for i, sub_program in enumerate(encoded_program):
+    if bracketed:
+        raise ValueError("Program has a '[' with no matching ']'.")
+    _close()
+    return Program(tuple(stages))
+
+
+class Instrument(NamedTuple):
+    name: str
+    heat_rate: float  # Celsius per second
+    cool_rate: float  # Celsius per second
+    start_temperature: float = 25  # Block temperature when a run starts
+
+
+# Average block ramp rates, roughly what the spec sheets give. Time a real run and add your own if it matters.
+INSTRUMENTS = {
+    "generic": Instrument("generic", 3.0, 2.0),
+    "biorad_c1000": Instrument("biorad_c1000", 3.3, 2.5),
+    "ab_proflex": Instrument("ab_proflex", 6.0, 4.5),
+    "eppendorf_nexus": Instrument("eppendorf_nexus", 3.0, 2.0),
+    "mini_pcr": Instrument("mini_pcr", 1.0, 0.7),
+}
+
+
+class RuntimeEstimate(NamedTuple):
+    total_seconds: float
+    stage_seconds: Tuple[float, ...]
+    ramp_seconds: float
+    hold_seconds: float
+
+
+def _instrument(instrument):
+    return INSTRUMENTS[instrument] if isinstance(instrument, str) else instrument
+
+
+def _transitions(programs):
+    """Flattens programs into one row per distinct move between steps, without expanding cycles.
+
+    Each row is (program, stage, from, to, ramp repeats, hold seconds, hold repeats). 'from' is NaN for the very
+    first step, which starts from the instrument's idle temperature. Stages are numbered across all programs.
+    Stages with no cycles never run, so they get a number but no rows.
+    """
+    rows = []
+    stage_id = 0
+    for index, program in enumerate(programs):
+        if isinstance(program, str):
+            program = parse_program(program)
+        previous = float("nan")
+        for stage in program.stages:
+            steps, cycles = stage.steps, stage.cycles
+            if cycles <= 0:
+                stage_id += 1
+                continue
+            rows.append((index, stage_id, previous, steps[0].temperature, 1, steps[0].seconds, cycles))
+            for step, next_step in zip(steps, steps[1:]):
+                rows.append((index, stage_id, step.temperature, next_step.temperature, cycles, next_step.seconds, cycles))
+            if cycles > 1:  # Back to the top of the stage for every cycle after the first
+                rows.append((index, stage_id, steps[-1].temperature, steps[0].temperature, cycles - 1, 0, 0))
+            previous = steps[-1].temperature
+            stage_id += 1
+    return rows
+
+
+def _costs(rows, instrument):
+    """Ramp and hold seconds for every _transitions() row at once."""
+    import numpy as np
+    table = np.array(rows, dtype=float).reshape(-1, 7)
+    start = np.where(np.isnan(table[:, 2]), instrument.start_temperature, table[:, 2])
+    change = table[:, 3] - start
+    rate = np.where(change > 0, instrument.heat_rate, instrument.cool_rate)
+    ramps = np.abs(change) / rate * table[:, 4]
+    holds = table[:, 5] * table[:, 6]  # Holds of 0:00 last until someone stops the run, so add nothing
+    return table, ramps, holds
+
+
+def estimate_runtimes(programs, instrument="generic"):
+    """Total seconds each of many programs takes on 'instrument', as a NumPy array, in one vectorized pass."""
+    import numpy as np
+    programs = list(programs)
+    rows = _transitions(programs)
+    if not rows:
+        return np.zeros(len(programs))
+    table, ramps, holds = _costs(rows, _instrument(instrument))
+    return np.bincount(table[:, 0].astype(int), weights=ramps + holds, minlength=len(programs))
+
+
+def estimate_runtime(program, instrument="generic") -> RuntimeEstimate:
+    """How long a program takes on 'instrument' (a name from INSTRUMENTS or an Instrument), split by stage.
+
+    Ramps between temperatures are included, indefinite holds (0:00) are not.
+    """
+    import numpy as np
+    if isinstance(program, str):
+        program = parse_program(program)
+    rows = _transitions([program])
+    if not rows:
+        return RuntimeEstimate(0.0, (0.0,) * len(program.stages), 0.0, 0.0)
+    table, ramps, holds = _costs(rows, _instrument(instrument))
+    stages = np.bincount(table[:, 1].astype(int), weights=ramps + holds, minlength=len(program.stages))
+    return RuntimeEstimate(float(stages.sum()), tuple(float(stage) for stage in stages), float(ramps.sum()),
+                           float(holds.sum()))
+
+
+def temperature_trace(program, instrument="generic", sample_seconds=1.0):
+    """Block temperature over a run, as (seconds, celsius) NumPy arrays sampled every 'sample_seconds'.
+
+    Ramps are linear at the instrument's heating or cooling rate. The trace ends when the last timed step does.
+    """
+    import numpy as np
+    instrument = _instrument(instrument)
+    if isinstance(program, str):
+        program = parse_program(program)
+    steps = [step for stage in program.stages for _ in range(stage.cycles) for step in stage.steps]
+    temperatures = np.array([instrument.start_temperature] + [step.temperature for step in steps])
+    holds = np.array([step.seconds for step in steps])
+    change = np.diff(temperatures)
+    ramps = np.abs(change) / np.where(change > 0, instrument.heat_rate, instrument.cool_rate)
+    # Knots at the start of the run, then the end of each ramp and the end of each hold
+    knot_times = np.concatenate([[0], np.cumsum(np.column_stack([ramps, holds]).ravel())])
+    knot_temperatures = np.concatenate([[temperatures[0]], np.repeat(temperatures[1:], 2)])
+    times = np.arange(0, knot_times[-1] + sample_seconds, sample_seconds)
+    return times, np.interp(times, knot_times, knot_temperatures)
+
+
+TEXT_COLOR = (50, 50, 50)
+LINE_COLOR = (150, 150, 150)
+FONT_SIZE = 60
+LINE_WIDTH = 5
+
+
+def _layout(program, scale=1.0):
+    """Works out where everything goes, shared by the raster and SVG renderers.
+
+    Returns (width, height, lines, texts) with lines as (x0, y0, x1, y1) and texts as (x, y, text). The canvas is
+    only as wide as the program needs, rather than a fixed 7000 pixels.
+    """
+    ordered_temperatures = program.temperatures
+    lines, texts, line_ends = [], [], []
+    height = 700+100*(len(ordered_temperatures)-1)
+    x, y = 0, 5
+    for i, stage in enumerate(program.stages):
         if i != 0:
-            pcr_diagram.line((current_position[0]-5, 0) + (current_position[0]-5, imgheight), fill=line_color, width=5)
-        pcr_diagram.text((current_position[0],0),
-                         f"{encoded_program[f'{sub_program}']['cycles']}x",
-                         fill=text_color, font=font)
-        current_position[0] -= 300
-        for step in encoded_program[f"{sub_program}"]["steps"]:
-            current_position[0] += 500
-            pcr_diagram.text((current_position[0]+5,current_position[1]+250+100*ordered_temperatures.index(step[0])),
-                             f"{step[0]}",
-                             fill=text_color, font=font)
-            line_ends.append([current_position[0]-80,current_position[1]+380+100*ordered_temperatures.index(step[0])])
-            line_ends.append([current_position[0]+300,current_position[1]+380+100*ordered_temperatures.index(step[0])])
-            pcr_diagram.text((current_position[0],current_position[1]+420+100*ordered_temperatures.index(step[0])),
-                             f"{step[1]}",
-                             fill=text_color, font=font)
-        current_position[0] += 500
-    for i, line_end in enumerate(line_ends[1:]):
-        pcr_diagram.line((line_ends[i][0], line_ends[i][1]) + (line_end[0], line_end[1]), fill=line_color, width=5)
-    img.show()
-    img.save("img.png")
+            lines.append((x-5, 0, x-5, height))
+        texts.append((x, 0, f"{stage.cycles}x"))
+        x -= 300
+        for step in stage.steps:
+            level = 100*ordered_temperatures.index(step.temperature)
+            x += 500
+            texts.append((x+5, y+250+level, _format_temperature(step.temperature)))
+            line_ends.append((x-80, y+380+level))
+            line_ends.append((x+300, y+380+level))
+            texts.append((x, y+420+level, _format_time(step.seconds)))
+        x += 500
+    lines.extend(start + end for start, end in zip(line_ends, line_ends[1:]))
+    width = max(x, 1)
+    return (round(width*scale), round(height*scale), [tuple(value*scale for value in line) for line in lines],
+            [(tx*scale, ty*scale, text) for tx, ty, text in texts])
+
+
+@lru_cache(maxsize=None)
+def _font(size):
+    """Loads the label font once per size, falling back to what Pillow ships with if Arial isn't installed."""
+    from PIL import ImageFont
+    for name in ("arial.ttf", "Arial.ttf", "DejaVuSans.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            pass
+    return ImageFont.load_default(size)
+
+
+def _draw(program, scale=1.0):
+    """Draws a parsed Program onto a new Pillow image."""
+    from PIL import Image, ImageDraw  # Imported here so scripts that never draw don't pay for Pillow
+    width, height, lines, texts = _layout(program, scale)
+    img = Image.new('RGB', (width, height), color='white')
+    pcr_diagram = ImageDraw.Draw(img)
+    font = _font(max(1, round(FONT_SIZE*scale)))
+    line_width = max(1, round(LINE_WIDTH*scale))
+    for line in lines:
+        pcr_diagram.line(line, fill=LINE_COLOR, width=line_width)
+    for x, y, text in texts:
+        pcr_diagram.text((x, y), text, fill=TEXT_COLOR, font=font)
+    return img
+
+
+def _svg(program, scale=1.0) -> bytes:
+    """SVG of a parsed Program, built as text with no rasterizing or Pillow involved."""
+    from html import escape
+    width, height, lines, texts = _layout(program, scale)
+    rgb = "rgb({},{},{})".format
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'viewBox="0 0 {width} {height}" font-family="Arial, Helvetica, sans-serif" '
+             f'font-size="{FONT_SIZE*scale:g}">',
+             '<rect width="100%" height="100%" fill="white"/>',
+             f'<g stroke="{rgb(*LINE_COLOR)}" stroke-width="{LINE_WIDTH*scale:g}" stroke-linecap="round">']
+    parts.extend(f'<line x1="{x0:g}" y1="{y0:g}" x2="{x1:g}" y2="{y1:g}"/>' for x0, y0, x1, y1 in lines)
+    parts.append(f'</g><g fill="{rgb(*TEXT_COLOR)}" dominant-baseline="hanging">')
+    parts.extend(f'<text x="{x:g}" y="{y:g}">{escape(text)}</text>' for x, y, text in texts)
+    parts.append("</g></svg>")
+    return "\n".join(parts).encode()
+
+
+class RenderCache:
+    """Rendered images keyed by a hash of the program's exact stages and steps and the render options.
+
+    Keeps the most recent 'max_items' in memory and, if 'directory' is set, every image on disk as <hash>.<format>,
+    so identical programs are only ever drawn once. Safe to share between threads: the memory cache is behind a
+    lock and disk entries are written to a temporary file and renamed into place, so readers never see half a file.
+    """
+
+    def __init__(self, max_items=128, directory=None):
+        self.max_items = max_items
+        self.directory = directory
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(program, **options) -> str:
+        # The tuples themselves rather than normalized(), which rounds times and drops 1[ ] brackets that are drawn
+        content = json.dumps([program, options], sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def _path(self, key, image_format):
+        return os.path.join(self.directory, f"{key}.{image_format}")
+
+    def get(self, key, image_format="png"):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return data
+        try:
+            if not self.directory:
+                raise FileNotFoundError
+            with open(self._path(key, image_format), "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        self.put(key, data, image_format, write=False)
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data, image_format="png", write=True):
+        with self._lock:
+            self._items[key] = data
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        if write and self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(handle, "wb") as f:
+                    f.write(data)
+                os.replace(temporary, self._path(key, image_format))
+            except BaseException:
+                os.unlink(temporary)
+                raise
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+
+render_cache = RenderCache()
+
+
+def render(program, image_format="png", fp=None, scale=1.0, cache=render_cache):
+    """Renders a program schematic without opening a viewer or touching shared files, so it is safe to call from
+    several threads at once.
+
+    'program' is a string or Program and 'image_format' is "png" or "svg". SVG is written as text and never
+    rasterized, handy for HTML and notebooks. 'scale' shrinks or grows the whole drawing. Returns the image
+    bytes, or writes them to the binary file object 'fp' if one is given. Repeats come from 'cache' (None to skip).
+    """
+    if image_format not in ("png", "svg"):
+        raise ValueError(f"Image format '{image_format}' unrecognized, use 'png' or 'svg'")
+    if isinstance(program, str):
+        program = parse_program(program)
+    key = RenderCache.key(program, image_format=image_format, scale=scale)
+    data = cache.get(key, image_format) if cache is not None else None
+    if data is None:
+        if image_format == "svg":
+            data = _svg(program, scale)
+        else:
+            buffer = BytesIO()
+            _draw(program, scale).save(buffer, format="PNG")
+            data = buffer.getvalue()
+        if cache is not None:
+            cache.put(key, data, image_format)
+    if fp is None:
+        return data
+    fp.write(data)
+
+
+def render_png(program, cache=render_cache) -> bytes:
+    """PNG bytes of a program schematic, see render()."""
+    return render(program, cache=cache)
+
+
+def pcr_image(program, filename="img.png", show=True):
+    """Draws a program, opens it in the default viewer and saves it. Use render() from scripts and services."""
+    img = _draw(parse_program(program))
+    if show:
+        img.show()
+    if filename:
+        img.save(filename)
+
+
+def read_programs(path):
+    """Reads (name, program string) pairs from a file of one program per line, or JSON.
+
+    JSON can be a list of programs or a {name: program} object. Blank lines and lines starting with '#' are
+    skipped, and unnamed programs are called program_0001 and so on by position.
+    """
+    with open(path) as f:
+        text = f.read()
+    if path.lower().endswith(".json") or text.lstrip()[:1] in ("[", "{"):
+        programs = json.loads(text)
+        if isinstance(programs, dict):
+            return list(programs.items())
+    else:
+        programs = [line.strip() for line in text.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+    return [(f"program_{i+1:04d}", program) for i, program in enumerate(programs)]
+
+
+def _render_timed(program, image_format, scale):
+    """Renders one program for render_batch(), returning (bytes, seconds). Module level so process pools can run it."""
+    start = time.perf_counter()
+    data = render(program, image_format, scale=scale, cache=None)
+    return data, time.perf_counter() - start
+
+
+def render_batch(programs, output, image_format="png", scale=1.0, workers=None, processes=False):
+    """Renders many programs in parallel, writing each to a folder or a single .zip as soon as it is done.
+
+    'programs' is a file for read_programs() or a list of (name, program) pairs. Programs that parse to the same
+    stages and steps are only rendered once and written under every name that asked for them. Uses threads unless
+    'processes' is True. A program that fails to parse or render is reported and skipped, the rest still run.
+    Returns one report dict per program, in input order, with its name, file, seconds and error (None if it worked).
+    """
+    import zipfile
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+    if isinstance(programs, str):
+        programs = read_programs(programs)
+    reports, names_by_key = [], OrderedDict()
+    for name, program in programs:
+        report = {"name": name, "program": program, "file": f"{name}.{image_format}", "seconds": None,
+                  "error": None, "duplicate_of": None}
+        reports.append(report)
+        try:
+            parsed = parse_program(program)
+        except ValueError as e:
+            report["error"] = str(e)
+            continue
+        key = RenderCache.key(parsed, image_format=image_format, scale=scale)
+        if key in names_by_key:
+            report["duplicate_of"] = names_by_key[key][0]["name"]
+        names_by_key.setdefault(key, []).append(report)
+    archive = None
+    if output.lower().endswith(".zip"):
+        archive = zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED)
+    else:
+        os.makedirs(output, exist_ok=True)
+    pool = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(workers)
+    try:
+        with pool:
+            futures = {pool.submit(_render_timed, same[0]["program"], image_format, scale): same
+                       for same in names_by_key.values()}
+            for future in as_completed(futures):  # Written as they finish, so only in-flight images sit in memory
+                same = futures.pop(future)
+                try:
+                    data, seconds = future.result()
+                except Exception as e:
+                    for report in same:
+                        report["error"] = f"{type(e).__name__}: {e}"
+                    continue
+                for report in same:
+                    report["seconds"] = seconds if report["duplicate_of"] is None else 0.0
+                    if archive is not None:
+                        archive.writestr(report["file"], data)
+                    else:
+                        with open(os.path.join(output, report["file"]), "wb") as f:
+                            f.write(data)
+    finally:
+        if archive is not None:
+            archive.close()
+    return reports
+
+
+def main(argv=None):
+    """Command line entry point. With no arguments it draws an example program."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Render thermocycler program schematics in bulk.")
+    parser.add_argument("programs", nargs="?", help="file with one program per line, or JSON")
+    parser.add_argument("-o", "--output", default="schematics", help="folder, or a .zip file, to write images to")
+    parser.add_argument("-f", "--format", choices=["png", "svg"], default="png")
+    parser.add_argument("-s", "--scale", type=float, default=1.0)
+    parser.add_argument("-w", "--workers", type=int)
+    parser.add_argument("-p", "--processes", action="store_true", help="use processes instead of threads")
+    parser.add_argument("-r", "--report", help="write the per-program report to this JSON file")
+    args = parser.parse_args(argv)
+    if args.programs is None:
+        #pcr_image("98/0:30 32[ 98/0:20 55/0:20 72/0:40 ] 72/2 4/0:00")
+        pcr_image("25[ 42/1:30 16/3:00 ] 50/5:00 80/10:00 4/0:00")
+        return
+    reports = render_batch(args.programs, args.output, args.format, args.scale, args.workers, args.processes)
+    for report in reports:
+        if report["error"]:
+            print(f"FAILED {report['name']}: {report['error']}")
+        elif report["duplicate_of"]:
+            print(f"{report['file']}: same as {report['duplicate_of']}")
+        else:
+            print(f"{report['file']}: {report['seconds']:.3f}s")
+    failed = sum(1 for report in reports if report["error"])
+    print(f"{len(reports) - failed} of {len(reports)} rendered, {failed} failed")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(reports, f, indent=2)
+
 
 if __name__ == '__main__':
-    #pcr_image("98/0:30 32[ 98/0:20 55/0:20 72/0:40 ] 72/2 4/0:00")
-    pcr_image("25[ 42/1:30 16/3:00 ] 50/5:00 80/10:00 4/0:00")
+    main()